@@ -6,6 +6,7 @@ urlpatterns = [
     # ========================= 系统用户 ===========================================
     re_path(r'^own/$', views.UserOwn.as_view()),
     re_path(r'^own/has_perm/$', views.UserHasPerm.as_view()),
+    re_path(r'^own/has_perms/$', views.UserHasPerms.as_view()),
     re_path(r'^own/menu/$', views.UserOwnMenu.as_view()),
     re_path(r'^logout/$', views.LogoutView.as_view()),
 
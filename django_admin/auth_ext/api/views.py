@@ -1,3 +1,7 @@
+from django.apps import apps
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
 from rest_framework import generics, serializers, response, permissions, exceptions, status
 from rest_framework.authentication import SessionAuthentication
 from rest_framework_jwt.views import JSONWebTokenAPIView, JSONWebTokenSerializer
@@ -7,7 +11,7 @@ from auth_ext.models import ExternalUser, Permission, Role
 from auth_ext.authentication import set_token, delete_token
 from auth_ext.serializers import PermissionSerializer, UserSerializer, RoleSerializer, SimplePermissionSerializer, \
     SimpleRoleSerializer, PermConfigSerializer
-from auth_ext.menu import get_menu_for_user, MenuItem
+from auth_ext.menu import get_menu_payload_for_user, MenuItem
 from rest_framework.response import Response as DetailResponse
 from rest_framework import generics as generics_ext, serializers as serializers_ext
 from auth_ext.models import User
@@ -56,9 +60,15 @@ class UserOwnMenu(generics.GenericAPIView):
     def get(self, request, *args, **kwargs):
         if not request.user or not request.user.is_authenticated:
             raise exceptions.AuthenticationFailed()
-        menu_tree = get_menu_for_user(request.user)
-        serializer = self.get_serializer(instance=menu_tree, many=True)
-        return response.Response(data=serializer.data)
+        # 菜单按权限签名缓存了JSON字节串，不再经过MenuSerializer和JSON编码；内容不变时返回304，
+        # If-None-Match按弱比较匹配（经nginx gzip后强ETag会变为W/"..."）
+        etag, payload = get_menu_payload_for_user(request.user)
+        resp = get_conditional_response(request, etag=etag)
+        if resp is None:
+            resp = HttpResponse(payload, content_type='application/json')
+        resp['ETag'] = etag
+        resp['Cache-Control'] = 'private, no-cache'
+        return resp
 
 
 class UserHasPerm(generics.GenericAPIView):
@@ -80,6 +90,70 @@ class UserHasPerm(generics.GenericAPIView):
         return response.Response(data={'has_perm': has_perm})
 
 
+class UserHasPerms(generics.GenericAPIView):
+    """
+    post:
+    批量验证当前用户的权限
+    perms: 权限code列表，返回 {code: 是否拥有}
+    objects: 对象级权限验证列表，如 {"perm": "app.change_model", "model": "app.model", "pk": 1}，按顺序返回验证结果
+    patterns: 通配符列表，如 logistic.*，返回 {pattern: 拥有的权限code列表}
+
+    """
+    class DefaultSerializer(serializers.Serializer):
+        class ObjectPermSerializer(serializers.Serializer):
+            perm = serializers.CharField(max_length=200)
+            model = serializers.CharField(max_length=200, help_text='app_label.model_name')
+            pk = serializers.CharField(max_length=100)
+
+        perms = serializers.ListField(child=serializers.CharField(max_length=200), required=False, max_length=500)
+        objects = ObjectPermSerializer(many=True, required=False)
+        patterns = serializers.ListField(child=serializers.CharField(max_length=200), required=False, max_length=20)
+
+        def validate_objects(self, value):
+            if len(value) > 200:
+                raise exceptions.ValidationError('objects数量不能超过200')
+            return value
+
+    serializer_class = DefaultSerializer
+
+    def _check_objects(self, user, checks):
+        """ 对象按model分组批量查询后验证 """
+        pks_by_model = {}
+        for item in checks:
+            pks_by_model.setdefault(item['model'], set()).add(item['pk'])
+
+        instances = {}
+        for model_label, pks in pks_by_model.items():
+            try:
+                model_class = apps.get_model(model_label)
+                objs = model_class._default_manager.in_bulk(list(pks))
+            except (LookupError, ValueError, DjangoValidationError):
+                continue
+            for pk, obj in objs.items():
+                instances[(model_label, str(pk))] = obj
+
+        result = []
+        for item in checks:
+            obj = instances.get((item['model'], item['pk']))
+            result.append(bool(obj is not None and user.has_perm(item['perm'], obj=obj)))
+        return result
+
+    def post(self, request, *args, **kwargs):
+        if not request.user or not request.user.is_authenticated:
+            raise exceptions.AuthenticationFailed()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        user = request.user
+
+        result = {
+            'perms': user.has_perms_bulk(data.get('perms', [])),
+            'objects': self._check_objects(user, data.get('objects', [])),
+            'patterns': {p: sorted(user.get_perms_matching(p)) for p in data.get('patterns', [])},
+        }
+        return response.Response(data=result)
+
+
 class JSONWebTokenObtain(JSONWebTokenAPIView):
     """
     get:
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AuthExtConfig(AppConfig):
     name = 'auth_ext'
     verbose_name = '认证与权限'
+
+    def ready(self):
+        from auth_ext.perm_mapping import build_registry
+        build_registry()
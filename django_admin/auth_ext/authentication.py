@@ -1,60 +1,106 @@
-import json
-import time
-import logging
+import hashlib
+import hmac
 from rest_framework import authentication as drf_authentication, exceptions
 from django.conf import settings
 from django.apps import apps
-from django_redis import get_redis_connection
+from core_ext.metrics import get_redis_connection
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_jwt import authentication as jwt_authentication
+from rest_framework_jwt.settings import api_settings as jwt_settings
 from .models import Token
 from auth_ext.caches import UserCache
+from auth_ext.local_cache import LocalCache, invalidation_bus
+from core_ext.access_log import add_access_log
 
 
-_TOKEN_CACHE_KEY = 'NEW_LMS_TOKEN_CACHE'        # 缓存的token白名单
+_TOKEN_KEY_PROFIT = 'lms:auth:token'             # 按用户分片的token白名单，值为token摘要
+_LEGACY_TOKEN_CACHE_KEY = 'NEW_LMS_TOKEN_CACHE'  # 旧版token白名单hash，兼容已登录的用户
+
+# 进程内已验证token缓存 {token_key: digest}，set_token/delete_token时通过pub/sub广播失效
+_token_local_cache = LocalCache(
+    max_size=getattr(settings, 'LMS_AUTH_TOKEN_LOCAL_CACHE_SIZE', 10000),
+    timeout=getattr(settings, 'LMS_AUTH_TOKEN_LOCAL_CACHE_TIMEOUT', 30),
+)
+invalidation_bus.subscribe(
+    lambda cache_key: _token_local_cache.clear() if cache_key is None else _token_local_cache.delete(cache_key))
+
+
+def _get_token_key(user_pk):
+    return f'{_TOKEN_KEY_PROFIT}:{user_pk}'
+
+
+def _get_token_digest(token):
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).hexdigest()
+
+
+def _get_token_timeout():
+    """ token白名单过期时间，与JWT有效期一致 """
+    return int(jwt_settings.JWT_EXPIRATION_DELTA.total_seconds())
+
+
+def _invalidate_token(user):
+    token_key = _get_token_key(user.pk)
+    _token_local_cache.delete(token_key)
+    invalidation_bus.publish(token_key)
 
 
 def get_token_by_user(user):
-    """ 缓存中获取token """
+    """ 缓存中获取token摘要 """
     client = get_redis_connection('default')
-    token = client.hget(_TOKEN_CACHE_KEY, user.pk)
-    return token
+    digest = client.get(_get_token_key(user.pk))
+    if digest is not None:
+        return digest.decode()
+
+    # 兼容旧版白名单，命中后迁移到分片key
+    token = client.hget(_LEGACY_TOKEN_CACHE_KEY, user.pk)
+    if token is None:
+        return None
+    digest = _get_token_digest(token)
+    pipe = client.pipeline(transaction=False)
+    pipe.set(_get_token_key(user.pk), digest, ex=_get_token_timeout())
+    pipe.hdel(_LEGACY_TOKEN_CACHE_KEY, user.pk)
+    pipe.execute()
+    return digest
 
 
 def set_token(user, token):
     """ 缓存token """
     client = get_redis_connection('default')
-    client.hset(_TOKEN_CACHE_KEY, user.pk, token)
+    pipe = client.pipeline(transaction=False)
+    pipe.set(_get_token_key(user.pk), _get_token_digest(token), ex=_get_token_timeout())
+    pipe.hdel(_LEGACY_TOKEN_CACHE_KEY, user.pk)
+    pipe.execute()
+    _invalidate_token(user)
     UserCache().clear(user.username)    # 用户重新登录时清空权限缓存
 
 
 def validate_token(user, token):
-    """ 验证token """
-    exist_token = get_token_by_user(user)
-    return exist_token and exist_token == token
+    """ 验证token，优先从进程内缓存验证 """
+    invalidation_bus.ensure_listening()
+    token_key = _get_token_key(user.pk)
+    digest = _get_token_digest(token)
+    if _token_local_cache.get(token_key) == digest:
+        return True
+
+    exist_digest = get_token_by_user(user)
+    if exist_digest is None or not hmac.compare_digest(exist_digest, digest):
+        return False
+    _token_local_cache.set(token_key, digest)
+    return True
 
 
 def delete_token(user):
     """ 删除token """
     client = get_redis_connection('default')
-    client.hdel(_TOKEN_CACHE_KEY, user.pk)
-
-
-def add_access_log(name, sid, uri):
-    access_logger = logging.getLogger('access_log')
-    try:
-        data = {
-            "name": name,
-            "sid": sid,
-            "action_time": time.strftime("%Y-%m-%dT%H:%M:%S+08:00", time.localtime()),
-            "uri": uri,
-            "system": "new_lms"
-        }
-        access_logger.info(msg=json.dumps(data))
-    except Exception as e:
-        pass
+    pipe = client.pipeline(transaction=False)
+    pipe.delete(_get_token_key(user.pk))
+    pipe.hdel(_LEGACY_TOKEN_CACHE_KEY, user.pk)
+    pipe.execute()
+    _invalidate_token(user)
 
 
 class JSONWebTokenAuthentication(jwt_authentication.JSONWebTokenAuthentication):
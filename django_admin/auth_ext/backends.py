@@ -5,7 +5,6 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 from cas import CASClient
-from django.apps import apps
 from django.conf import settings
 from django.conf import settings as django_settings
 from django.contrib.auth import get_user_model
@@ -14,11 +13,14 @@ from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
 from django_cas_ng.signals import cas_user_authenticated
 
-from auth_ext.models import Role, Permission, get_role_permissions
-from auth_ext.models.permission import SUDO_PERMISSION, STAFF_PERMISSION, AUTHENTICATED_PERMISSION, ALLOW_ANY_PERMISSION
-from auth_ext.mixins import PermMappableMixin
+from auth_ext.models import Permission, get_roles_permissions
+from auth_ext.models.permission import STAFF_PERMISSION, AUTHENTICATED_PERMISSION, ALLOW_ANY_PERMISSION
+from auth_ext import perm_mapping
+from auth_ext.context import get_request_cache
 from auth_ext.star_access_client import get_user_relationship_roles
 from auth_ext.caches import UserCache
+from auth_ext.bitset import perm_index, has_bit
+from auth_ext.inverted_index import AuthIndex
 
 __all__ = ['CASBackend', 'AuthOnlyModelBackend', 'PermBackend', 'PermMappingBackend']
 
@@ -223,59 +225,127 @@ class PermBackend(object):
     """ 权限验证后端 """
     perm_cache = caches['auth']
 
+    # 用户权限缓存的field，见auth_ext.caches.UserCache
+    CACHE_FIELDS = ('default_roles', 'roles', 'default_permissions', 'permissions', 'perm_bits')
+
     def authenticate(self, username=None, password=None, **kwargs):
         # 不做认证处理
         return None
 
     def has_perm(self, user_obj, perm, obj=None):
-        return user_obj.is_active and perm in self.get_all_permissions(user_obj, obj)
+        if not user_obj.is_active:
+            return False
+        index = perm_index.get_index(perm)
+        if index is None:
+            # 映射表中不存在的权限退回集合判断
+            return perm in self.get_all_permissions(user_obj, obj)
+        return has_bit(self.get_permission_bits(user_obj, obj), index)
+
+    def warm_up(self, user_obj, obj=None):
+        """
+        一次读取用户全部权限缓存，计算缺失的部分后通过一次pipeline写回
+        :return: {field: value}, field见CACHE_FIELDS
+        """
+        perm_index.refresh()
+        cache = UserCache()
+        state = cache.get_many(user_obj.username, self.CACHE_FIELDS)
+        updates = {}
+
+        # 空集合也是有效的缓存值，只有field不存在时才重新计算
+        if state['default_roles'] is None:
+            state['default_roles'] = updates['default_roles'] = get_user_relationship_roles(user_obj.username)
+        if state['roles'] is None:
+            state['roles'] = updates['roles'] = {
+                *state['default_roles'],
+                *self._get_user_roles(user_obj, obj),
+            }
+        if state['default_permissions'] is None:
+            state['default_permissions'] = updates['default_permissions'] = \
+                self._build_default_permissions(user_obj, state['roles'])
+        if state['permissions'] is None:
+            state['permissions'] = updates['permissions'] = {
+                *state['default_permissions'],
+                *self._get_user_permissions(user_obj, obj),
+            }
+        perm_bits = state['perm_bits']
+        if updates or perm_bits is None or perm_bits[0] < perm_index.version:
+            # 位图版本低于映射表版本时重新生成，见auth_ext.bitset
+            state['perm_bits'] = updates['perm_bits'] = (perm_index.version, perm_index.encode(state['permissions']))
+
+        if updates:
+            cache.set_many(user_obj.username, updates)
+            # 用户缓存写入时续期，索引随之续期，保证索引不早于用户缓存失效
+            AuthIndex().index_users({user_obj.username: state['roles']})
+        return state
+
+    def get_permission_bits(self, user_obj, obj=None):
+        """ 获取用户权限位图 """
+        if not user_obj.is_active or user_obj.is_anonymous:
+            return 0
+        # 只读取位图，位图不存在或版本过期时才加载全部权限缓存
+        perm_index.refresh()
+        perm_bits = UserCache().get(user_obj.username, 'perm_bits')
+        if perm_bits is None or perm_bits[0] < perm_index.version:
+            perm_bits = self.warm_up(user_obj, obj)['perm_bits']
+        return perm_bits[1]
 
     def get_all_permissions(self, user_obj, obj=None):
         """ 获取用户所有权限 """
         if not user_obj.is_active or user_obj.is_anonymous:
             return set()
-
-        cache = UserCache()
-        perm_codes = cache.get(user_obj.username, 'permissions')
-        if perm_codes:
-            # 用户权限缓存命中
-            return perm_codes
-
-        perm_codes = {
-            *self._get_default_permissions(user_obj, obj),
-            *self._get_user_permissions(user_obj, obj),
-        }
-        cache.set(user_obj.username, 'permissions', perm_codes)
-
-        return perm_codes
+        return self.warm_up(user_obj, obj)['permissions']
 
     def _get_default_permissions(self, user_obj, obj=None):
         """ 获取系统级别权限 """
-        cache = UserCache()
-        default_permissions = cache.get(user_obj.username, 'default_permissions')
-        if default_permissions:
-            return default_permissions
+        return self.warm_up(user_obj, obj)['default_permissions']
 
+    def _build_default_permissions(self, user_obj, role_codes, role_permissions=None, all_permissions=None):
+        """
+        计算系统级别权限
+        :param role_codes: 用户角色code
+        :param role_permissions: 预先查询好的角色权限 {role_code: perm_codes}，不传时批量获取
+        :param all_permissions: 预先查询好的全部权限code，超级管理员使用，不传时查询
+        """
         perms = {ALLOW_ANY_PERMISSION}
         if user_obj.is_authenticated:
             perms.add(AUTHENTICATED_PERMISSION)
             if user_obj.is_staff:
                 perms.add(STAFF_PERMISSION)
                 if user_obj.is_superuser:
-                    perms.add(SUDO_PERMISSION)
-
                     # 超级管理员拥有所有权限
-                    all_perm_codes = set(Permission.objects.all().values_list('code', flat=True))
-                    cache.set(user_obj.username, 'default_permissions', all_perm_codes)
-                    return all_perm_codes
+                    if all_permissions is None:
+                        all_permissions = Permission.objects.all().values_list('code', flat=True)
+                    return set(all_permissions)
 
-        default_permissions = {
-            *perms,
-            *self._get_role_permissions(user_obj, obj),
-        }
-        cache.set(user_obj.username, 'default_permissions', default_permissions)
+        if role_permissions is None:
+            role_permissions = get_roles_permissions(role_codes)
+        role_perms = set()
+        for role_code in role_codes:
+            role_perms.update(role_permissions.get(role_code, set()))
+        return {*perms, *role_perms}
 
-        return default_permissions
+    def build_state(self, user_obj, default_roles, user_roles, user_permissions, role_permissions,
+                    all_permissions=None):
+        """
+        根据预先查询好的数据计算用户全部权限缓存，用于批量预计算
+        :param default_roles: StarAccess映射的默认角色
+        :param user_roles: 数据库中配置的用户角色
+        :param user_permissions: 数据库中配置的用户权限
+        :param role_permissions: {role_code: perm_codes}
+        :param all_permissions: 全部权限code，批量处理时只查询一次供所有超级管理员使用
+        :return: {field: value}, field见CACHE_FIELDS
+        """
+        roles = {*default_roles, *user_roles}
+        default_permissions = self._build_default_permissions(user_obj, roles, role_permissions, all_permissions)
+        permissions = {*default_permissions, *user_permissions}
+        perm_bits = perm_index.encode(permissions)
+        return {
+            'default_roles': default_roles,
+            'roles': roles,
+            'default_permissions': default_permissions,
+            'permissions': permissions,
+            'perm_bits': (perm_index.version, perm_bits),
+        }
 
     def _get_user_permissions(self, user_obj, obj=None):
         """ 获取数据库中配置的用户权限 """
@@ -283,39 +353,20 @@ class PermBackend(object):
             user_obj._lms_db_perm_cache = {p.code for p in user_obj.lms_permissions.all()}
         return user_obj._lms_db_perm_cache
 
-    def _get_role_permissions(self, user_obj, obj=None):
-        """ 获取用户角色拥有的权限 """
-        role_codes = self.get_all_roles(user_obj, obj)
+    def _get_role_permissions(self, role_codes):
+        """ 获取角色拥有的权限 """
         perm_set = set()
-        for role_code in role_codes:
-            perm_set.update(get_role_permissions(role_code))
+        for perm_codes in get_roles_permissions(role_codes).values():
+            perm_set.update(perm_codes)
         return perm_set
 
     def get_all_roles(self, user_obj, obj=None):
         """ 获取用户所有角色 """
-        cache = UserCache()
-        roles = cache.get(user_obj.username, 'roles')
-        if roles:
-            # 用户角色缓存命中
-            return roles
-
-        roles = {
-            *self._get_default_roles(user_obj, obj),
-            *self._get_user_roles(user_obj, obj),
-        }
-        cache.set(user_obj.username, 'roles', roles)
-        return roles
+        return self.warm_up(user_obj, obj)['roles']
 
     def _get_default_roles(self, user_obj, obj=None):
         """ 获取系统默认用户角色code """
-        cache = UserCache()
-        default_roles = cache.get(user_obj.username, 'default_roles')
-        if default_roles:
-            return default_roles
-
-        default_roles = get_user_relationship_roles(user_obj.username)
-        cache.set(user_obj.username, 'default_roles',  default_roles)
-        return default_roles
+        return self.warm_up(user_obj, obj)['default_roles']
 
     def _get_user_roles(self, user_obj, obj=None):
         """ 获取数据库中配置的用户所有角色 """
@@ -330,17 +381,31 @@ class PermMappingBackend(object):
         return None
 
     def has_perm(self, user_obj, perm, obj=None):
-        try:
-            app_label, rest = perm.split('.')
-            model_name = rest.split('_', 1)[-1]
-            model_class = apps.get_model(app_label, model_name)
-        except:
+        perm_mapping.stats['calls'] += 1
+        model_class = perm_mapping.get_mapped_model(perm)
+        if model_class is None:
+            # 未做权限映射的model直接返回
+            perm_mapping.stats['unmapped'] += 1
             return False
 
-        if issubclass(model_class, PermMappableMixin):
-            # 处理做过权限映射的model
-            mapped_perm, mapped_obj = model_class.mapping_permission(perm, obj=obj)
-            if mapped_perm:
-                # 验证用户是否拥有上级权限
-                return user_obj.has_perm(mapped_perm, obj=mapped_obj)
-        return False
+        # 同一请求内相同(用户, 权限, 对象)的映射结果缓存
+        request_cache = get_request_cache()
+        memo_key = None
+        if request_cache is not None and (obj is None or obj.pk is not None):
+            memo_key = (user_obj.pk, perm, obj._meta.label if obj is not None else None,
+                        obj.pk if obj is not None else None)
+            if memo_key in request_cache.perm_mapping:
+                perm_mapping.stats['memo_hits'] += 1
+                return request_cache.perm_mapping[memo_key]
+
+        # 处理做过权限映射的model
+        perm_mapping.stats['mapped'] += 1
+        result = False
+        mapped_perm, mapped_obj = model_class.mapping_permission(perm, obj=obj)
+        if mapped_perm:
+            # 验证用户是否拥有上级权限
+            result = user_obj.has_perm(mapped_perm, obj=mapped_obj)
+
+        if memo_key is not None:
+            request_cache.perm_mapping[memo_key] = result
+        return result
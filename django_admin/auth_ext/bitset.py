@@ -0,0 +1,99 @@
+"""
+    权限位图引擎
+    为每个Permission分配稳定的整数下标（直接使用主键，主键不会被复用），用户的有效权限以整数位图表示，
+    has_perm只需要一次位运算。
+    映射表 code -> 下标 带版本号保存在Redis中，由PermissionDetector.auto_discover_permissions重建，
+    用户位图缓存中记录生成时的版本号，版本号单调递增，位图版本低于当前映射表版本时视为失效；
+    下标即主键，不随版本变化，重建后各进程最多CHECK_INTERVAL秒内版本不一致，旧版本进程直接使用新版本的位图，
+    不会与新版本进程互相覆盖，每个用户的位图每次重建只重新生成一次。
+"""
+import time
+from django.conf import settings
+from core_ext.metrics import get_redis_connection
+
+
+class PermissionIndex(object):
+    """ 版本化的权限code -> 位下标映射表 """
+    KEY_PROFIT = 'lms:auth:perm_index'
+    CHECK_INTERVAL = getattr(settings, 'LMS_PERM_INDEX_CHECK_INTERVAL', 30)     # 检查版本号的间隔（秒）
+
+    def __init__(self, alias='auth'):
+        self.alias = alias
+        self.version = None
+        self.table = {}
+        self._checked_at = 0
+
+    @property
+    def table_key(self):
+        return f'{self.KEY_PROFIT}:table'
+
+    @property
+    def version_key(self):
+        return f'{self.KEY_PROFIT}:version'
+
+    def _get_client(self):
+        return get_redis_connection(self.alias)
+
+    def rebuild(self):
+        """ 根据数据库中的权限重建映射表，版本号自增 """
+        from auth_ext.models import Permission
+        table = dict(Permission.all_objects.values_list('code', 'pk'))
+
+        pipe = self._get_client().pipeline()
+        pipe.delete(self.table_key)
+        if table:
+            pipe.hmset(self.table_key, table)
+        pipe.incr(self.version_key)
+        version = pipe.execute()[-1]
+
+        self._load(version, table)
+        return version
+
+    def _load(self, version, table):
+        self.version = int(version)
+        self.table = table
+        self._checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """ 定期检查Redis中的版本号，版本变化时重新加载映射表 """
+        if not force and self.version is not None and time.monotonic() - self._checked_at < self.CHECK_INTERVAL:
+            return
+        client = self._get_client()
+        version = client.get(self.version_key)
+        if version is None:
+            # 映射表尚未生成
+            self.rebuild()
+            return
+        if int(version) == self.version:
+            self._checked_at = time.monotonic()
+            return
+        raw_table = client.hgetall(self.table_key)
+        table = {k.decode(): int(v) for k, v in raw_table.items()}
+        self._load(version, table)
+
+    def get_index(self, perm_code):
+        """ 获取权限的位下标，不存在时返回None """
+        self.refresh()
+        return self.table.get(perm_code)
+
+    def encode(self, perm_codes):
+        """ 权限code集合转换为位图，映射表中不存在的权限忽略 """
+        self.refresh()
+        bits = 0
+        for code in perm_codes:
+            index = self.table.get(code)
+            if index is not None:
+                bits |= 1 << index
+        return bits
+
+    def decode(self, bits):
+        """ 位图转换为权限code集合 """
+        self.refresh()
+        return {code for code, index in self.table.items() if bits >> index & 1}
+
+
+def has_bit(bits, index):
+    return bool(bits >> index & 1)
+
+
+perm_index = PermissionIndex()
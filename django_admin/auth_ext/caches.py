@@ -1,41 +1,213 @@
-import pickle
-from django_redis import get_redis_connection
+from django.conf import settings
+from core_ext.metrics import get_redis_connection
+from auth_ext.codecs import get_codec
+from auth_ext.context import get_request_cache
+from auth_ext.local_cache import get_local_cache, invalidation_bus
 
 
 class HashCache(object):
-    """ Redis Hash类型缓存处理封装 """
+    """
+    Redis Hash类型缓存处理封装
+    读取顺序: 请求级缓存 -> 进程内缓存 -> Redis，启用前两者时一次HGETALL加载整个hash
+    """
     KEY_PROFIT = 'lms:auth'
+    REQUEST_CACHE = False           # 是否使用请求级缓存
+    LOCAL_CACHE = False             # 是否使用进程内缓存（需配置LMS_AUTH_LOCAL_CACHE）
+    TIMEOUT = None                  # key的失效时间（秒），每次写入时续期，None表示不失效
+    codec = get_codec()             # 缓存值编解码器，见auth_ext.codecs
 
     def __init__(self, alias='auth', write=True):
         self._client = get_redis_connection(alias, write)
 
+    def _loads(self, data):
+        return self.codec.loads(data)
+
+    def _hgetall(self, cache_key):
+        return {f.decode(): self._loads(v) for f, v in self._client.hgetall(cache_key).items()}
+
+    def _get_cached_hash(self, cache_key):
+        """ 从请求级缓存、进程内缓存获取整个hash数据，都未启用时返回None """
+        request_cache = get_request_cache() if self.REQUEST_CACHE else None
+        local_cache = get_local_cache() if self.LOCAL_CACHE else None
+        if request_cache is None and local_cache is None:
+            return None
+
+        if request_cache is not None:
+            data = request_cache.data.get(cache_key)
+            if data is not None:
+                request_cache.hits += 1
+                return data
+            request_cache.misses += 1
+
+        data = local_cache.get(cache_key) if local_cache is not None else None
+        if data is None:
+            data = self._hgetall(cache_key)
+            if local_cache is not None:
+                local_cache.set(cache_key, data)
+
+        if request_cache is not None:
+            data = request_cache.data[cache_key] = dict(data)
+        return data
+
+    def _invalidate(self, cache_key, pipe):
+        """ 写操作后的缓存处理，进程内缓存直接删除并广播失效消息 """
+        if self.LOCAL_CACHE:
+            local_cache = get_local_cache()
+            if local_cache is not None:
+                local_cache.delete(cache_key)
+                invalidation_bus.publish(cache_key, client=pipe)
+
+    def _after_write(self, cache_key, pipe):
+        """ 写入后续期key并处理缓存失效 """
+        if self.TIMEOUT:
+            pipe.expire(cache_key, self.TIMEOUT)
+        self._invalidate(cache_key, pipe)
+
     def get(self, key, field):
         cache_key = f'{self.KEY_PROFIT}:{key}'
+        cached_data = self._get_cached_hash(cache_key)
+        if cached_data is not None:
+            return cached_data.get(field)
+
         data = self._client.hget(cache_key, field)
-        try:
-            return pickle.loads(data)
-        except:
-            return data
+        return self._loads(data)
+
+    def get_many(self, key, fields):
+        """
+        批量获取hash key的多个field
+        :return: {field: value}，不存在的field值为None
+        """
+        cache_key = f'{self.KEY_PROFIT}:{key}'
+        cached_data = self._get_cached_hash(cache_key)
+        if cached_data is not None:
+            return {f: cached_data.get(f) for f in fields}
+
+        values = self._client.hmget(cache_key, *fields)
+        return {f: self._loads(v) for f, v in zip(fields, values)}
+
+    def get_many_keys(self, keys, field):
+        """
+        批量获取多个hash key的同一个field，未命中进程内缓存的key通过一次pipeline获取
+        :return: {key: value}，不存在时值为None
+        """
+        local_cache = get_local_cache() if self.LOCAL_CACHE else None
+        result = {}
+        pending = []
+        for key in keys:
+            cache_key = f'{self.KEY_PROFIT}:{key}'
+            cached_data = local_cache.get(cache_key) if local_cache is not None else None
+            if cached_data is not None:
+                result[key] = cached_data.get(field)
+            else:
+                pending.append(key)
+        if not pending:
+            return result
+
+        pipe = self._client.pipeline(transaction=False)
+        for key in pending:
+            cache_key = f'{self.KEY_PROFIT}:{key}'
+            if local_cache is not None:
+                # 启用进程内缓存时获取整个hash以便写入进程内缓存
+                pipe.hgetall(cache_key)
+            else:
+                pipe.hget(cache_key, field)
+        for key, data in zip(pending, pipe.execute()):
+            if local_cache is not None:
+                data = {f.decode(): self._loads(v) for f, v in data.items()}
+                local_cache.set(f'{self.KEY_PROFIT}:{key}', data)
+                result[key] = data.get(field)
+            else:
+                result[key] = self._loads(data)
+        return result
+
+    def get_all(self, key):
+        """ 获取hash key的全部field """
+        cache_key = f'{self.KEY_PROFIT}:{key}'
+        cached_data = self._get_cached_hash(cache_key)
+        if cached_data is not None:
+            return dict(cached_data)
+        return self._hgetall(cache_key)
 
     def set(self, key, field, value):
+        self.set_many(key, {field: value})
+
+    def set_many(self, key, mapping):
+        """ 批量设置hash key的多个field，与续期、失效广播在同一个pipeline中执行 """
         cache_key = f'{self.KEY_PROFIT}:{key}'
-        try:
-            value = pickle.dumps(value)
-        except:
+        data = {}
+        for field, value in mapping.items():
+            try:
+                data[field] = self.codec.dumps(value)
+            except:
+                continue
+        if not data:
             return
-        # 注意：hash key不再设置失效时间，通常是登出时清空缓存
-        self._client.hset(cache_key, field, value)
+
+        pipe = self._client.pipeline()
+        pipe.hmset(cache_key, data)
+        self._after_write(cache_key, pipe)
+        pipe.execute()
+
+        request_cache = get_request_cache()
+        if request_cache is not None and cache_key in request_cache.data:
+            request_cache.data[cache_key].update({f: mapping[f] for f in data})
+
+    def bulk_set(self, data):
+        """
+        多个hash key批量设置，所有写操作在一个pipeline中执行
+        :param data: {key: {field: value}}
+        """
+        pipe = self._client.pipeline(transaction=False)
+        for key, mapping in data.items():
+            cache_key = f'{self.KEY_PROFIT}:{key}'
+            pipe.hmset(cache_key, {f: self.codec.dumps(v) for f, v in mapping.items()})
+            self._after_write(cache_key, pipe)
+        pipe.execute()
+
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            for key in data.keys():
+                request_cache.data.pop(f'{self.KEY_PROFIT}:{key}', None)
 
     def delete(self, key, field):
         cache_key = f'{self.KEY_PROFIT}:{key}'
-        self._client.hdel(cache_key, field)
+        pipe = self._client.pipeline()
+        pipe.hdel(cache_key, field)
+        self._invalidate(cache_key, pipe)
+        pipe.execute()
+
+        request_cache = get_request_cache()
+        if request_cache is not None and cache_key in request_cache.data:
+            request_cache.data[cache_key].pop(field, None)
 
     def clear(self, key):
         """ 清空hash key """
         cache_key = f'{self.KEY_PROFIT}:{key}'
-        fields = self._client.hkeys(cache_key)
-        if fields:
-            self._client.hdel(cache_key, *fields)
+        pipe = self._client.pipeline()
+        pipe.unlink(cache_key)
+        self._invalidate(cache_key, pipe)
+        pipe.execute()
+
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            request_cache.data.pop(cache_key, None)
+
+    def bulk_clear(self, keys):
+        """ 一次pipeline清空多个hash key """
+        keys = list(keys)
+        if not keys:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for key in keys:
+            cache_key = f'{self.KEY_PROFIT}:{key}'
+            pipe.unlink(cache_key)
+            self._invalidate(cache_key, pipe)
+        pipe.execute()
+
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            for key in keys:
+                request_cache.data.pop(f'{self.KEY_PROFIT}:{key}', None)
 
 
 class UserCache(HashCache):
@@ -45,9 +217,12 @@ class UserCache(HashCache):
         default_permissions -> set: 用户默认权限
         roles -> set: 用户角色全集
         default_roles -> set: 用户默认角色
-        relationship -> dict: StarAccess用户数据
+        perm_bits -> tuple: (映射表版本号, 用户权限位图)
     """
     KEY_PROFIT = 'lms:auth:user'
+    REQUEST_CACHE = True
+    LOCAL_CACHE = True
+    TIMEOUT = getattr(settings, 'LMS_AUTH_USER_CACHE_TIMEOUT', 60*60*24*7)
 
 
 class RoleCache(HashCache):
@@ -57,3 +232,14 @@ class RoleCache(HashCache):
          default_permissions -> set: 角色默认权限
     """
     KEY_PROFIT = 'lms:auth:role'
+    LOCAL_CACHE = True
+    TIMEOUT = getattr(settings, 'LMS_AUTH_ROLE_CACHE_TIMEOUT', 60*60*24*7)
+
+
+class RelationshipCache(HashCache):
+    """
+    StarAccess用户关系缓存，与UserCache分开保存，用户重新登录清空权限缓存时不受影响，field可为:
+        data -> dict: {'data': 用户关系, 'ok': 最近一次获取是否成功, 'fetched_at': 最近一次获取的时间戳}
+    """
+    KEY_PROFIT = 'lms:auth:relationship'
+    TIMEOUT = getattr(settings, 'LMS_AUTH_RELATIONSHIP_CACHE_TIMEOUT', 60*60*24*7)
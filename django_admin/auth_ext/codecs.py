@@ -0,0 +1,138 @@
+"""
+    权限缓存编解码
+    缓存值大多是权限/角色code的字符串集合，使用排序后换行拼接的文本存储，StarAccess用户关系等结构化数据使用JSON，
+    权限位图使用十六进制文本，均不依赖pickle，其他语言的服务也可以直接读取。
+    编码结果以格式标记开头，如 b'S1:'，标记中的数字为格式版本号；没有标记的旧数据按pickle解码。
+    无法解码的数据（损坏、截断）记录日志后返回None，按缓存未命中处理。
+
+    通过 LMS_AUTH_CACHE_CODEC 配置使用的编解码器，默认 auth_ext.codecs.TaggedCodec
+"""
+import json
+import logging
+import pickle
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+# 解码损坏、截断的数据时可能抛出的异常，json.JSONDecodeError、UnicodeDecodeError均为ValueError的子类
+DECODE_ERRORS = (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError, IndexError)
+
+
+class BaseCodec(object):
+    """ 单一格式编解码器 """
+    tag = b''
+
+    def can_encode(self, value):
+        raise NotImplementedError
+
+    def encode(self, value):
+        raise NotImplementedError
+
+    def decode(self, data):
+        raise NotImplementedError
+
+
+class StringSetCodec(BaseCodec):
+    """ 字符串集合，排序后以换行拼接；包含空字符串的集合无法与空集合区分，由其他编解码器处理 """
+    tag = b'S1:'
+
+    def can_encode(self, value):
+        return isinstance(value, (set, frozenset)) and all(isinstance(i, str) and i and '\n' not in i for i in value)
+
+    def encode(self, value):
+        return '\n'.join(sorted(value)).encode()
+
+    def decode(self, data):
+        if not data:
+            return set()
+        return set(data.decode().split('\n'))
+
+
+class BitsCodec(BaseCodec):
+    """ 权限位图 (版本号, 位图)，格式为 <版本号>:<十六进制位图> """
+    tag = b'B1:'
+
+    def can_encode(self, value):
+        return isinstance(value, tuple) and len(value) == 2 and all(type(i) is int for i in value)
+
+    def encode(self, value):
+        version, bits = value
+        return f'{version}:{bits:x}'.encode()
+
+    def decode(self, data):
+        version, bits = data.decode().split(':')
+        return int(version), int(bits, 16)
+
+
+class JsonCodec(BaseCodec):
+    """ JSON可表示的数据 """
+    tag = b'J1:'
+
+    def can_encode(self, value):
+        return isinstance(value, (dict, list, str, int, float, bool))
+
+    def encode(self, value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def decode(self, data):
+        return json.loads(data.decode())
+
+
+class PickleCodec(BaseCodec):
+    """ 兜底格式 """
+    tag = b'P1:'
+
+    def can_encode(self, value):
+        return True
+
+    def encode(self, value):
+        return pickle.dumps(value)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class TaggedCodec(object):
+    """ 按值的类型选择编解码器，编码结果带格式标记 """
+    codecs = (StringSetCodec(), BitsCodec(), JsonCodec(), PickleCodec())
+
+    def dumps(self, value):
+        for codec in self.codecs:
+            if codec.can_encode(value):
+                return codec.tag + codec.encode(value)
+        raise ValueError(f'unsupported value: {value!r}')
+
+    def loads(self, data):
+        if data is None:
+            return None
+        try:
+            for codec in self.codecs:
+                if data.startswith(codec.tag):
+                    return codec.decode(data[len(codec.tag):])
+            # 兼容旧版本pickle数据
+            return pickle.loads(data)
+        except DECODE_ERRORS as e:
+            logger.error(f'auth cache decode error: {e!r}, data: {data[:32]!r}')
+            return None
+
+
+class LegacyPickleCodec(object):
+    """ 旧版本的pickle格式，不带格式标记 """
+
+    def dumps(self, value):
+        return pickle.dumps(value)
+
+    def loads(self, data):
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except DECODE_ERRORS as e:
+            logger.error(f'auth cache decode error: {e!r}, data: {data[:32]!r}')
+            return None
+
+
+def get_codec():
+    return import_string(getattr(settings, 'LMS_AUTH_CACHE_CODEC', 'auth_ext.codecs.TaggedCodec'))()
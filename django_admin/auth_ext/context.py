@@ -0,0 +1,54 @@
+"""
+    请求级权限缓存
+    一次请求内通过一次HGETALL加载用户的整个权限hash（lms:auth:user:<username>），之后同一请求中的
+    has_perm/get_all_roles/get_default_permissions等读取都直接由内存提供。
+    通过contextvar保存，在中间件auth_ext.middleware.PermContextMiddleware或perm_context()中生效，
+    未激活时HashCache行为不变。
+"""
+import contextvars
+from contextlib import contextmanager
+
+
+_request_cache = contextvars.ContextVar('lms_auth_request_cache', default=None)
+
+
+class RequestCache(object):
+    """ 请求内的hash缓存, 格式为 {cache_key: {field: value}} """
+
+    def __init__(self):
+        self.data = {}
+        self.perm_mapping = {}  # 权限映射结果 {(user_pk, perm, model_label, obj_pk): bool}
+        self.hits = 0           # 内存命中次数
+        self.misses = 0         # 访问Redis次数
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'keys': len(self.data)}
+
+
+def get_request_cache():
+    """ 获取当前上下文的请求缓存，未激活时返回None """
+    return _request_cache.get()
+
+
+def activate():
+    """ 激活请求缓存，返回用于恢复上下文的token """
+    return _request_cache.set(RequestCache())
+
+
+def deactivate(token):
+    _request_cache.reset(token)
+
+
+@contextmanager
+def perm_context():
+    """
+    非请求场景（celery任务、脚本等）下手动开启请求缓存
+
+    with perm_context() as request_cache:
+        ...
+    """
+    token = activate()
+    try:
+        yield get_request_cache()
+    finally:
+        deactivate(token)
@@ -0,0 +1,94 @@
+"""
+    权限倒排索引，用于影响分析和精确的缓存失效
+    * 角色 -> 用户: Redis set lms:auth:index:role:<role_code>，在用户权限缓存计算（warm_up/批量预计算）时维护，
+      包含StarAccess映射的默认角色；lms:auth:index:user:<username>记录上次索引的角色，用于移除失效的关系
+    * 权限 -> 角色: 数据库nlms_role_permission表本身即为倒排索引，直接查询
+    角色权限或用户角色变化时，通过索引找到受影响的用户，一次pipeline清除其UserCache
+"""
+from django.db.models import Q
+from core_ext.metrics import get_redis_connection
+from auth_ext.caches import UserCache
+
+
+class AuthIndex(object):
+    KEY_PROFIT = 'lms:auth:index'
+    TIMEOUT = UserCache.TIMEOUT         # 与用户权限缓存的失效时间一致，每次索引用户时续期
+
+    def __init__(self, alias='auth', write=True):
+        self._client = get_redis_connection(alias, write)
+
+    def _role_key(self, role_code):
+        return f'{self.KEY_PROFIT}:role:{role_code}'
+
+    def _user_key(self, username):
+        return f'{self.KEY_PROFIT}:user:{username}'
+
+    def index_users(self, user_roles):
+        """
+        更新用户的角色索引
+        :param user_roles: {username: role_codes}
+        """
+        if not user_roles:
+            return
+        usernames = list(user_roles.keys())
+        pipe = self._client.pipeline(transaction=False)
+        for username in usernames:
+            pipe.smembers(self._user_key(username))
+        old_roles_list = pipe.execute()
+
+        pipe = self._client.pipeline(transaction=False)
+        for username, old_roles in zip(usernames, old_roles_list):
+            old_roles = {r.decode() for r in old_roles}
+            new_roles = set(user_roles[username])
+            for role_code in old_roles - new_roles:
+                pipe.srem(self._role_key(role_code), username)
+            for role_code in new_roles - old_roles:
+                pipe.sadd(self._role_key(role_code), username)
+            if old_roles != new_roles:
+                pipe.delete(self._user_key(username))
+                if new_roles:
+                    pipe.sadd(self._user_key(username), *new_roles)
+            if self.TIMEOUT:
+                pipe.expire(self._user_key(username), self.TIMEOUT)
+                for role_code in new_roles:
+                    pipe.expire(self._role_key(role_code), self.TIMEOUT)
+        pipe.execute()
+
+    def get_role_usernames(self, role_codes):
+        """ 获取拥有任意一个角色的用户名，包括索引中的用户和数据库中配置的用户 """
+        from auth_ext.models.role import UserRoleMapping
+        role_codes = list(role_codes)
+        if not role_codes:
+            return set()
+        usernames = {u.decode() for u in self._client.sunion(*[self._role_key(r) for r in role_codes])}
+        usernames.update(UserRoleMapping.objects.filter(
+            role__code__in=role_codes).values_list('user__username', flat=True))
+        return usernames
+
+    def get_permission_roles(self, perm_code):
+        """ 获取拥有某个权限的角色code """
+        from auth_ext.models import Role
+        return set(Role.objects.filter(permissions__code=perm_code).values_list('code', flat=True))
+
+    def get_permission_usernames(self, perm_code):
+        """
+        获取拥有某个权限的用户名（谁拥有权限X），来源:
+        拥有该权限的角色的用户、数据库直接配置该权限的用户、超级管理员
+        StarAccess映射的角色只包含已计算过权限缓存的用户，需要完整结果时先执行批量预计算
+        """
+        from auth_ext.models import User
+        usernames = self.get_role_usernames(self.get_permission_roles(perm_code))
+        usernames.update(User.objects.filter(is_active=True).filter(
+            Q(lms_permissions__code=perm_code) | Q(is_staff=True, is_superuser=True)
+        ).values_list('username', flat=True))
+        return usernames
+
+    def invalidate_users(self, usernames):
+        """ 一次pipeline清除多个用户的权限缓存 """
+        UserCache().bulk_clear(usernames)
+
+    def invalidate_roles(self, role_codes):
+        """ 清除拥有任意一个角色的用户的权限缓存 """
+        usernames = self.get_role_usernames(role_codes)
+        self.invalidate_users(usernames)
+        return usernames
@@ -0,0 +1,149 @@
+"""
+    进程内缓存
+    权限数据改动少、读取频繁，每个worker进程内维护一层有容量和时间上限的LRU缓存，位于Redis之前。
+    HashCache写入/删除时通过Redis pub/sub广播失效消息，各进程的监听线程收到后删除本地缓存。
+
+    配置（不配置则不启用）:
+    LMS_AUTH_LOCAL_CACHE = {
+        'MAX_SIZE': 10000,      # 最大缓存key数量
+        'TIMEOUT': 60,          # 缓存时间（秒），兜底丢失的失效消息
+    }
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache(object):
+    """ 线程安全的LRU缓存，超出容量淘汰最久未使用的key，超时的key在读取时淘汰 """
+
+    def __init__(self, max_size=10000, timeout=60):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if expire_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class InvalidationBus(object):
+    """ 基于Redis pub/sub的缓存失效广播，消息格式为 <worker_id>|<cache_key> """
+    CHANNEL = 'lms:auth:invalidate'
+    RECONNECT_INTERVAL = 1
+
+    def __init__(self, alias='auth'):
+        self.alias = alias
+        self.worker_id = None
+        self._pid = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+        注册失效回调
+        :param callback: 参数为失效的cache_key，为None时表示需要清空全部本地缓存
+        """
+        self._callbacks.append(callback)
+
+    def ensure_listening(self):
+        """ 启动监听线程，fork后的子进程会重新启动 """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.worker_id = f'{self._pid}:{uuid.uuid4().hex}'
+            # fork前的本地缓存不可信
+            self._dispatch(None)
+            thread = threading.Thread(target=self._listen, name='lms-auth-invalidation', daemon=True)
+            thread.start()
+
+    def publish(self, cache_key, client=None):
+        """
+        广播失效消息
+        :param cache_key: 失效的cache_key
+        :param client: redis连接或pipeline，传入pipeline时随pipeline一起执行
+        """
+        self.ensure_listening()
+        if client is None:
+            client = get_redis_connection(self.alias)
+        client.publish(self.CHANNEL, f'{self.worker_id}|{cache_key}')
+
+    def _dispatch(self, cache_key):
+        for callback in self._callbacks:
+            try:
+                callback(cache_key)
+            except Exception as e:
+                logger.exception(e)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis_connection(self.alias).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    worker_id, _, cache_key = message['data'].decode().partition('|')
+                    if worker_id != self.worker_id:
+                        self._dispatch(cache_key)
+            except Exception as e:
+                logger.error(f'auth cache invalidation listener error: {e}')
+            # 断线期间可能丢失失效消息，清空本地缓存
+            self._dispatch(None)
+            time.sleep(self.RECONNECT_INTERVAL)
+
+
+def _build_local_cache():
+    config = getattr(settings, 'LMS_AUTH_LOCAL_CACHE', None)
+    if not config:
+        return None
+    cache = LocalCache(max_size=config.get('MAX_SIZE', 10000), timeout=config.get('TIMEOUT', 60))
+    invalidation_bus.subscribe(lambda cache_key: cache.clear() if cache_key is None else cache.delete(cache_key))
+    return cache
+
+
+invalidation_bus = InvalidationBus()
+local_cache = _build_local_cache()
+
+
+def get_local_cache():
+    """ 获取进程内缓存，未配置时返回None """
+    if local_cache is not None:
+        invalidation_bus.ensure_listening()
+    return local_cache
@@ -0,0 +1,44 @@
+import pickle
+import timeit
+from django.core.management import BaseCommand
+from auth_ext.codecs import get_codec, LegacyPickleCodec
+
+
+def _sample_values():
+    """ 模拟的缓存数据 """
+    perm_codes = {f'app_{i % 20}.{action}_model{i}' for i in range(300) for action in ('view', 'change')}
+    role_codes = {'system:user', 'logistic:user', 'service:member', 'finance:leader', 'develop:user'}
+    relationship = {
+        'roles': [{'id': 1, 'name': '客服'}],
+        'levels': [{'id': 3, 'name': '专员'}],
+        'departments': [{'id': 12, 'name': '物流部'}, {'id': 13, 'name': '物流一部'}],
+        'positions': [{'id': 7, 'name': '客服专员'}],
+    }
+    perm_bits = (3, sum(1 << i for i in range(0, 1200, 2)))
+    return {
+        'permissions': perm_codes,
+        'roles': role_codes,
+        'relationship': relationship,
+        'perm_bits': perm_bits,
+    }
+
+
+class Command(BaseCommand):
+    help = '权限缓存编解码器与pickle的性能对比'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=10000, help='每项测试的执行次数')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        codecs = {'pickle': LegacyPickleCodec(), 'codec': get_codec()}
+
+        for name, value in _sample_values().items():
+            for codec_name, codec in codecs.items():
+                data = codec.dumps(value)
+                assert codec.loads(data) == value
+                dumps_time = timeit.timeit(lambda: codec.dumps(value), number=number) / number * 1e6
+                loads_time = timeit.timeit(lambda: codec.loads(data), number=number) / number * 1e6
+                print(f'{name:<14}{codec_name:<8}size: {len(data):>7}B  '
+                      f'dumps: {dumps_time:>8.2f}us  loads: {loads_time:>8.2f}us')
+        print(f'pickle protocol: {pickle.DEFAULT_PROTOCOL}')
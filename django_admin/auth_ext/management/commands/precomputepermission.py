@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand, CommandError
+from auth_ext.precompute import precompute_user_permissions
+from auth_ext.tasks import precompute_permissions_task
+
+
+class Command(BaseCommand):
+    help = '批量预计算激活用户的权限缓存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的用户数')
+        parser.add_argument('--processes', type=int, default=1, help='并行的进程数')
+        parser.add_argument('--async', action='store_true', dest='use_celery',
+                            help='发送celery任务异步执行，celery worker中只能单进程执行，不能与--processes同时使用')
+
+    def handle(self, *args, **options):
+        if options['use_celery']:
+            if options['processes'] != 1:
+                raise CommandError('--async cannot be used with --processes')
+            precompute_permissions_task.delay(batch_size=options['batch_size'])
+            print('task sent')
+            return
+
+        count = precompute_user_permissions(batch_size=options['batch_size'], processes=options['processes'])
+        print(f'users: {count}')
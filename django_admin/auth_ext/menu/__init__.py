@@ -1,2 +1,2 @@
 from .config import MENU_CONFIG
-from .base import get_menu_for_user, MenuItem
+from .base import get_menu_for_user, get_menu_data_for_user, get_menu_payload_for_user, MenuItem, COMPILED_MENU
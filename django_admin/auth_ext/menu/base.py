@@ -1,5 +1,10 @@
+import hashlib
+import json
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import List, Dict, Tuple, FrozenSet
+from django.utils.functional import cached_property
+from auth_ext.local_cache import LocalCache
+from auth_ext.perm_mapping import get_mapped_model
 from .config import MENU_CONFIG
 
 
@@ -53,7 +58,152 @@ def _get_menu_for_user(user, menu_tree):
     return result
 
 
+@dataclass(frozen=True)
+class CompiledMenuItem:
+    path: str
+    name: str
+    component: str
+    visible: Tuple[Tuple[str, FrozenSet[str]], ...]
+    permissions: FrozenSet[str]
+    children: Tuple['CompiledMenuItem', ...]
+
+
+class CompiledMenu(object):
+    """
+    编译后的只读菜单树
+    菜单配置只在启动时编译一次，过滤时只需要用户拥有的菜单相关权限集合，不再逐个节点调用has_perm。
+    过滤结果只取决于菜单版本和用户拥有的菜单相关权限，以两者的hash作为签名缓存序列化后的菜单，权限相同的用户共用缓存。
+    """
+
+    def __init__(self, menu_config, cache_size=256):
+        self.items = tuple(self._compile(d) for d in menu_config)
+        self.codes = frozenset(self._collect_codes(self.items))       # 菜单用到的所有权限
+        self.version = hashlib.sha1(json.dumps(menu_config, sort_keys=True).encode()).hexdigest()
+        self._cache = LocalCache(max_size=cache_size, timeout=60*60*24)
+
+    def _compile(self, item):
+        visible = item.get('visible') or {}
+        if not isinstance(visible, dict):
+            # 列表形式的按钮配置视为不需要权限
+            visible = {k: [] for k in visible}
+        return CompiledMenuItem(
+            path=item.get('path', ''),
+            name=item.get('name', ''),
+            component=item.get('component', ''),
+            visible=tuple((k, frozenset(perms or ())) for k, perms in visible.items()),
+            permissions=frozenset(item.get('permissions') or ()),
+            children=tuple(self._compile(d) for d in item.get('children') or ()),
+        )
+
+    def _collect_codes(self, items):
+        for item in items:
+            yield from item.permissions
+            for _, perms in item.visible:
+                yield from perms
+            yield from self._collect_codes(item.children)
+
+    @cached_property
+    def mappable_codes(self):
+        """ 属于权限映射model的权限，这类权限不在用户权限集合中，需要通过has_perm验证（首次使用时计算，需apps就绪） """
+        return frozenset(code for code in self.codes if get_mapped_model(code) is not None)
+
+    def get_granted_codes(self, user):
+        """ 获取用户拥有的菜单相关权限 """
+        if not user.is_active:
+            return frozenset()
+        if user.is_staff and user.is_superuser:
+            return self.codes
+
+        granted = self.codes & user.get_all_permissions()
+        mapped = {code for code in self.mappable_codes - granted if user.has_perm(code)}
+        return frozenset(granted | mapped)
+
+    def get_signature(self, granted):
+        """ 菜单版本 + 权限集合的签名 """
+        content = '\n'.join([self.version, *sorted(granted)])
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _filter(self, items, granted):
+        result = []
+        for item in items:
+            # 1. 验证子孙节点权限
+            has_children = bool(item.children)
+            children = self._filter(item.children, granted) if has_children else []
+
+            # 2. 判断当前节点是否有权限: 用户拥有节点的任意一种权限，则用户拥有当前节点的权限，节点没配置权限时视为有权限
+            has_perm = bool(item.permissions & granted) if item.permissions else True
+
+            # 验证按钮是否可见
+            visible = [k for k, perms in item.visible if not perms or perms & granted]
+
+            # 3. 确认当前节点是否可见
+            if item.permissions:
+                show = has_perm or bool(children)
+            else:
+                show = not has_children or bool(children)
+            if show:
+                result.append({
+                    'path': item.path,
+                    'name': item.name,
+                    'component': item.component,
+                    'children': children,
+                    'visible': visible,
+                })
+        return result
+
+    def _get_entry(self, granted):
+        """ 获取缓存的菜单数据，包含序列化后的JSON字节串 """
+        signature = self.get_signature(granted)
+        entry = self._cache.get(signature)
+        if entry is None:
+            data = self._filter(self.items, granted)
+            entry = {
+                'signature': signature,
+                'data': data,
+                'payload': json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode(),
+            }
+            self._cache.set(signature, entry)
+        return entry
+
+    def get_menu(self, granted):
+        """
+        获取权限集合对应的序列化菜单，返回的数据在用户间共享，不能修改
+        :return: (签名, 菜单数据)
+        """
+        entry = self._get_entry(granted)
+        return entry['signature'], entry['data']
+
+    def get_menu_payload(self, granted):
+        """
+        获取权限集合对应的菜单JSON字节串
+        :return: (签名, JSON字节串)
+        """
+        entry = self._get_entry(granted)
+        return entry['signature'], entry['payload']
+
+    def get_menu_for_user(self, user):
+        return self.get_menu(self.get_granted_codes(user))
+
+
+COMPILED_MENU = CompiledMenu(MENU_CONFIG)
+
+
+def get_menu_data_for_user(user):
+    """ 获取用户的序列化菜单 """
+    signature, data = COMPILED_MENU.get_menu_for_user(user)
+    return data
+
+
+def get_menu_payload_for_user(user):
+    """
+    获取用户菜单的JSON字节串及强ETag，签名由菜单版本和权限集合决定，签名相同则内容相同
+    :return: (etag, JSON字节串)
+    """
+    signature, payload = COMPILED_MENU.get_menu_payload(COMPILED_MENU.get_granted_codes(user))
+    return f'"{signature}"', payload
+
+
 def get_menu_for_user(user, menu_tree=None):
     if menu_tree is None:
-        menu_tree = [MenuItem(**d) for d in MENU_CONFIG]
+        return [MenuItem(**d) for d in get_menu_data_for_user(user)]
     return _get_menu_for_user(user, menu_tree)
@@ -0,0 +1,24 @@
+import logging
+from django.utils.deprecation import MiddlewareMixin
+from auth_ext.context import activate, deactivate, get_request_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class PermContextMiddleware(MiddlewareMixin):
+    """
+    请求级权限缓存中间件，需要放在认证相关中间件之前
+    请求结束后记录缓存命中情况，request.perm_cache_stats可获取统计数据
+    """
+    def __call__(self, request):
+        token = activate()
+        try:
+            response = super().__call__(request)
+        finally:
+            stats = get_request_cache().stats()
+            deactivate(token)
+
+        setattr(request, 'perm_cache_stats', stats)
+        logger.debug(f'{request.path} perm cache hits: {stats["hits"]}, misses: {stats["misses"]}')
+        return response
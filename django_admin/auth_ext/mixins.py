@@ -1,17 +1,24 @@
 class CreatorMixin(object):
+    creator_field = 'create_user'           # 创建者字段，用于查询集过滤
+
     def get_creator(self):
-        return self.create_user
+        return getattr(self, self.creator_field)
 
 
 class OwnerMixin(object):
+    owner_field = 'user'                    # 拥有者字段，用于查询集过滤
+
     def get_owner(self):
-        return self.user
+        return getattr(self, self.owner_field)
 
 
 class PermMappableMixin(object):
     """
     实现权限映射的 Model 基类。
+    perm_mapping_field: 指向映射后对象的外键路径（如 'order' 或 'order__shop'），查询集级别的权限过滤
+    （auth_ext.permissions.filter_queryset_by_perm）据此转换为SQL条件，未配置时不支持查询集级别的过滤。
     """
+    perm_mapping_field = None
 
     @classmethod
     def mapping_permission(cls, perm, obj=None):
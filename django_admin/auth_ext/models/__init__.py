@@ -1,4 +1,4 @@
 from .user import User, Membership
 from .permission import Permission
-from .role import Role, get_role_permissions
+from .role import Role, get_role_permissions, get_roles_permissions
 from .external import ExternalUser, Token
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from django.db import models, transaction
 from django.apps import apps as default_apps
 from auth_ext.mixins import PermMappableMixin
+from auth_ext.bitset import perm_index
 from core_ext.soft_delete import BaseSoftDeletableModel
 
 
@@ -56,6 +57,8 @@ class Permission(BaseSoftDeletableModel, models.Model):
 
     # 实现逻辑删除方法
     query_param = ~models.Q(status=STATUS_DISABLE)                  # 逻辑存在查询条件
+    soft_delete_field = 'status'
+    soft_delete_indexes = [('app_label', 'model_name')]             # 权限列表按app、model过滤
 
     def is_soft_deleted(self):
         """ 判断是否已删除 """
@@ -78,9 +81,9 @@ class Permission(BaseSoftDeletableModel, models.Model):
         查询集操作
         :param qs: 需要搜索的查询集
         :param deleted: 是否删除
-        :return:
+        :return: 更新的行数
         """
-        qs.update(status=cls.STATUS_DISABLE if deleted else cls.STATUS_ENABLE)
+        return qs.update(status=cls.STATUS_DISABLE if deleted else cls.STATUS_ENABLE)
 
     @classmethod
     def pretty(cls, queryset):
@@ -237,7 +240,10 @@ class PermissionDetector(object):
             Permission.all_objects.bulk_create(self.append_permissions)
             Permission.all_objects.bulk_update(self.update_permissions, batch_size=500,
                                                fields=['name', 'app_label', 'model_name', 'status'])
+        # 权限变化后重建权限位图映射表
+        version = perm_index.rebuild()
         return {
             'detect': len(self.detect_codes), 'default': len(self.DEFAULT_PERMISSIONS),
             'create': len(self.append_permissions), 'update': len(self.update_permissions), 'delete': delete_count,
+            'index_version': version,
         }
@@ -1,22 +1,51 @@
 from dataclasses import dataclass
 from django.db import models, transaction
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from core_ext.mixins import OperateCreateUpdateDeleteViewMixin
 from core_ext.soft_delete import BaseSoftDeletableModel
 from core_ext.exceptions import ProcessError
 from utils import gen_random_name
 from auth_ext.caches import RoleCache
+from auth_ext.inverted_index import AuthIndex
+from .permission import Permission
 
 
 def get_role_permissions(role_code):
+    """ 获取角色权限，角色不存在时返回None """
+    return get_roles_permissions([role_code]).get(role_code)
+
+
+def get_roles_permissions(role_codes):
+    """
+    批量获取角色权限，缓存通过一次pipeline读取，未命中的角色通过一次关联查询获取并回写缓存
+    :param role_codes: 角色code
+    :return: {role_code: perm_codes}，不存在的角色不包含在结果中
+    """
+    role_codes = set(role_codes)
+    if not role_codes:
+        return {}
+
     role_cache = RoleCache()
-    perm_codes = role_cache.get(role_code, 'permissions')
-    if perm_codes is None:
-        role_obj = Role.objects.filter(code=role_code).prefetch_related('permissions').first()
-        if role_obj:
-            perm_codes = {p.code for p in role_obj.permissions.all()}
-            role_cache.set(role_code, 'permissions', perm_codes)
-    return perm_codes
+    cached = role_cache.get_many_keys(role_codes, 'permissions')
+    result = {code: perm_codes for code, perm_codes in cached.items() if perm_codes is not None}
+    missing_codes = role_codes - result.keys()
+    if not missing_codes:
+        return result
+
+    # LEFT JOIN nlms_role_permission，没有权限的角色permissions__code为None
+    rows = Role.objects.filter(code__in=missing_codes).values_list(
+        'code', 'permissions__code', 'permissions__status')
+    fetched = {}
+    for role_code, perm_code, perm_status in rows:
+        perm_codes = fetched.setdefault(role_code, set())
+        if perm_code is not None and perm_status != Permission.STATUS_DISABLE:
+            perm_codes.add(perm_code)
+
+    if fetched:
+        role_cache.bulk_set({code: {'permissions': perm_codes} for code, perm_codes in fetched.items()})
+    result.update(fetched)
+    return result
 
 
 def _clean_role_permissions_cache(role_code):
@@ -70,6 +99,12 @@ class Role(OperateCreateUpdateDeleteViewMixin, BaseSoftDeletableModel, models.Mo
         mapping_model.objects.bulk_create(append_list)
         related_query.filter(user_id__in=delete_ids).delete()
 
+        # 修改后清除受影响用户的权限缓存，事务提交后执行以免并发请求读到旧数据重新缓存
+        changed_ids = append_ids | delete_ids
+        if changed_ids:
+            usernames = list(get_user_model().objects.filter(pk__in=changed_ids).values_list('username', flat=True))
+            transaction.on_commit(lambda: AuthIndex().invalidate_users(usernames))
+
     @property
     def permission_ids(self):
         return [i.permission_id for i in self.permission_map.all()]
@@ -88,8 +123,15 @@ class Role(OperateCreateUpdateDeleteViewMixin, BaseSoftDeletableModel, models.Mo
         mapping_model.objects.bulk_create(append_list)
         related_query.filter(permission_id__in=delete_ids).delete()
 
-        # 修改后清除权限缓存
-        _clean_role_permissions_cache(self.code)
+        # 修改后清除角色权限缓存及拥有该角色的用户的权限缓存，事务提交后执行以免并发请求读到旧数据重新缓存；
+        # 先清除角色缓存，用户缓存重建时才能读到新的角色权限
+        if append_ids or delete_ids:
+            role_code = self.code
+
+            def clean_cache():
+                _clean_role_permissions_cache(role_code)
+                AuthIndex().invalidate_roles([role_code])
+            transaction.on_commit(clean_cache)
 
     # ==================================== 逻辑删除实现 =====================================
     FLAG_DELETED = 1
@@ -101,6 +143,8 @@ class Role(OperateCreateUpdateDeleteViewMixin, BaseSoftDeletableModel, models.Mo
     is_deleted = models.IntegerField(choices=CHOICES_DELETE_TYPE, default=FLAG_EXISTS, verbose_name='删除标记')
 
     query_param = models.Q(is_deleted=FLAG_EXISTS)                  # 逻辑存在查询条件
+    soft_delete_field = 'is_deleted'
+    soft_delete_indexes = [('code', )]                              # 按code批量查询角色
 
     def is_soft_deleted(self):
         """ 判断是否已删除 """
@@ -125,9 +169,9 @@ class Role(OperateCreateUpdateDeleteViewMixin, BaseSoftDeletableModel, models.Mo
         查询集操作
         :param qs: 需要搜索的查询集
         :param deleted: 是否删除
-        :return:
+        :return: 更新的行数
         """
-        qs.update(is_deleted=cls.FLAG_DELETED if deleted else cls.FLAG_EXISTS)
+        return qs.update(is_deleted=cls.FLAG_DELETED if deleted else cls.FLAG_EXISTS)
 
     # ==================================== 用户操作方法 =======================================
     default_log_fields = ['code', 'name', 'user_ids', 'permission_ids', ]
@@ -1,10 +1,11 @@
+import fnmatch
 from django.contrib import auth
 from django.contrib.auth.models import AbstractUser, Group
 from django.core.exceptions import PermissionDenied
 from django.db import models, transaction
 from core_ext.mixins import OperateUpdateMixin
 from .permission import Permission
-from auth_ext.caches import UserCache
+from auth_ext.inverted_index import AuthIndex
 
 
 def _get_user_roles(user, obj=None):
@@ -16,9 +17,8 @@ def _get_user_roles(user, obj=None):
 
 
 def _clean_user_auth_cache(username):
-    """ 清除user的权限缓存，该用户权限变化后使用，不影响默认权限和角色 """
-    cache = UserCache()
-    cache.clear(username)
+    """ 清除user的权限缓存，该用户权限变化后使用；在事务中调用时等待事务提交后清除，避免并发请求缓存提交前的旧数据 """
+    transaction.on_commit(lambda: AuthIndex().invalidate_users([username]))
 
 
 class User(OperateUpdateMixin, AbstractUser):
@@ -90,6 +90,37 @@ class User(OperateUpdateMixin, AbstractUser):
                 return False
         return False
 
+    def has_perms_bulk(self, perm_list, obj=None):
+        """
+        批量验证权限，用户权限集合只获取一次，不在集合中的权限再交给其他权限后端（如权限映射）验证
+        :param perm_list: 权限code列表
+        :param obj: 验证的对象
+        :return: {perm: bool}
+        """
+        perm_list = list(perm_list)
+        if not self.is_active:
+            return {p: False for p in perm_list}
+        if self.is_staff and self.is_superuser:
+            return {p: True for p in perm_list}
+
+        perm_set = self.get_all_permissions(obj)
+        return {p: p in perm_set or self.has_perm(p, obj) for p in perm_list}
+
+    def get_perms_matching(self, pattern):
+        """
+        获取用户拥有的符合通配符的权限，如 logistic.* 或 logistic_rule.view_*，不包含权限映射model的权限
+        :param pattern: fnmatch通配符
+        :return: 权限code集合
+        """
+        if not self.is_active:
+            return set()
+        if self.is_staff and self.is_superuser:
+            # 与PermBackend._build_default_permissions一致，超级管理员拥有所有未禁用的权限
+            perm_set = Permission.objects.values_list('code', flat=True)
+        else:
+            perm_set = self.get_all_permissions()
+        return set(fnmatch.filter(perm_set, pattern))
+
     def get_all_permission_objs(self, obj=None):
         perm_codes = self.get_all_permissions(obj)
         perm_objs = set(Permission.objects.filter(code__in=perm_codes))
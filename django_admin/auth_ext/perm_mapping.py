@@ -0,0 +1,60 @@
+"""
+    权限映射model注册表
+    apps就绪时（AuthExtConfig.ready）收集所有实现了PermMappableMixin的model，PermMappingBackend通过
+    (app_label, model_name)直接查表，未映射的权限O(1)返回，不再每次调用apps.get_model和issubclass。
+"""
+from functools import lru_cache
+from django.apps import apps as default_apps
+from auth_ext.mixins import PermMappableMixin
+
+
+_registry = None            # {(app_label, model_name): model_class}
+
+# 调用统计（多线程下为近似值）
+stats = {
+    'calls': 0,             # PermMappingBackend.has_perm调用次数
+    'unmapped': 0,          # 未映射直接返回的次数
+    'mapped': 0,            # 实际执行权限映射的次数
+    'memo_hits': 0,         # 命中请求级缓存的次数
+}
+
+
+def build_registry(apps=default_apps):
+    """ 收集实现了权限映射的model """
+    global _registry
+    _registry = {
+        (model._meta.app_label, model._meta.model_name): model
+        for model in apps.get_models() if issubclass(model, PermMappableMixin)
+    }
+    return _registry
+
+
+def get_registry():
+    if _registry is None:
+        return build_registry()
+    return _registry
+
+
+@lru_cache(maxsize=4096)
+def parse_perm(perm):
+    """
+    解析权限code，app_label.action_modelname -> (app_label, modelname)
+    :return: 格式不正确时返回None
+    """
+    try:
+        app_label, rest = perm.split('.')
+    except (ValueError, AttributeError):
+        return None
+    return app_label, rest.split('_', 1)[-1].lower()
+
+
+def get_mapped_model(perm):
+    """ 获取权限对应的权限映射model，没有时返回None """
+    key = parse_perm(perm)
+    if key is None:
+        return None
+    return get_registry().get(key)
+
+
+def get_stats():
+    return dict(stats)
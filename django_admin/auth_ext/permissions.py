@@ -1,8 +1,11 @@
 """
     Django Rest Framework的权限后端重写，如果一个view有多个权限后端，则必须所有权限后端都返回True，否则定义为无权限
 """
-from rest_framework import permissions as drf_permissions
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from rest_framework import permissions as drf_permissions, filters as drf_filters
 from auth_ext.mixins import CreatorMixin, OwnerMixin
+from auth_ext.perm_mapping import get_mapped_model
 
 
 class DefaultPermission(drf_permissions.BasePermission):
@@ -60,3 +63,87 @@ class IsOwner(drf_permissions.BasePermission):
         if not isinstance(obj, OwnerMixin):
             return True
         return bool(request.user and request.user == obj.get_owner())
+
+
+# ========================================= 查询集级别的对象权限 ==========================================
+def _get_related_model(model, field_path):
+    """ 沿外键路径获取关联model """
+    for field_name in field_path.split('__'):
+        model = model._meta.get_field(field_name).related_model
+    return model
+
+
+def _get_perm_q(user, perm, queryset):
+    """
+    生成user.has_perm(perm, obj)对应的查询条件
+    :return: Q对象，Q()表示全部可见；None表示全部不可见
+    """
+    from auth_ext.backends import PermBackend
+    if user.is_staff and user.is_superuser:
+        return Q()
+    if PermBackend().has_perm(user, perm):
+        # 权限后端不区分对象，拥有权限即拥有所有对象的权限
+        return Q()
+
+    model_class = get_mapped_model(perm)
+    if model_class is None:
+        return None
+
+    mapped_perm, _ = model_class.mapping_permission(perm, obj=None)
+    field_path = model_class.perm_mapping_field
+    if not mapped_perm:
+        return None
+    if not field_path or not issubclass(queryset.model, model_class):
+        # 逐个对象验证需要把整个查询集加载到内存，不支持
+        raise ImproperlyConfigured(
+            f'{model_class._meta.label}.perm_mapping_field must be set to filter queryset by "{perm}"')
+
+    mapped_model = _get_related_model(model_class, field_path)
+    mapped_q = _get_perm_q(user, mapped_perm, mapped_model._default_manager.all())
+    if mapped_q is None:
+        return None
+    if not mapped_q:
+        return Q(**{f'{field_path}__isnull': False})
+    return Q(**{f'{field_path}__in': mapped_model._default_manager.filter(mapped_q).values('pk')})
+
+
+def filter_queryset_by_perm(user, perm, queryset, creator=False, owner=False):
+    """
+    按对象级权限过滤查询集，与UserQueryMixin.query_by_user配合使用，规则与逐个对象验证一致，但只需要一次查询
+    :param user: 用户
+    :param perm: 对象权限code，为None时不验证，实现PermMappableMixin的model沿perm_mapping_field映射到上级对象验证
+    :param queryset: 查询集
+    :param creator: 是否按IsCreator规则过滤，只保留user创建的对象
+    :param owner: 是否按IsOwner规则过滤，只保留user拥有的对象
+    :return: 过滤后的查询集
+    """
+    if not user or not user.is_authenticated:
+        return queryset.none()
+
+    model = queryset.model
+    q = Q()
+    if creator and issubclass(model, CreatorMixin):
+        q &= Q(**{model.creator_field: user})
+    if owner and issubclass(model, OwnerMixin):
+        q &= Q(**{model.owner_field: user})
+    if perm:
+        perm_q = _get_perm_q(user, perm, queryset)
+        if perm_q is None:
+            return queryset.none()
+        q &= perm_q
+    return queryset.filter(q)
+
+
+class ObjectPermissionFilter(drf_filters.BaseFilterBackend):
+    """
+    列表接口的对象权限过滤，view中配置了IsCreator/IsOwner时按对应规则过滤；
+    只有view中明确指定了对象权限code（view.object_permission）时才按权限过滤
+    """
+    def filter_queryset(self, request, view, queryset):
+        permission_classes = getattr(view, 'permission_classes', [])
+        perm = getattr(view, 'object_permission', None)
+        return filter_queryset_by_perm(
+            request.user, perm, queryset,
+            creator=IsCreator in permission_classes,
+            owner=IsOwner in permission_classes,
+        )
@@ -0,0 +1,96 @@
+"""
+    批量预计算用户权限缓存
+    角色权限变更或发布新权限后，所有用户的lms:auth:user:*缓存都是冷的，每个用户的第一次请求需要承担StarAccess请求、
+    角色查询和权限集合计算的开销。这里按批次为所有激活用户预先计算好roles、default_roles、default_permissions、
+    permissions（及权限位图），每批只需要几次批量查询和一次pipeline写入。
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from django.db import connections
+from auth_ext.backends import PermBackend
+from auth_ext.caches import UserCache
+from auth_ext.inverted_index import AuthIndex
+from auth_ext.models import User, Role, Permission, get_roles_permissions
+from auth_ext.models.role import UserRoleMapping
+from auth_ext.models.user import UserPermission
+from auth_ext.star_access_client import get_user_relationships, get_relationship_roles
+
+
+logger = logging.getLogger(__name__)
+
+
+def _group_values(values_list):
+    """ [(k, v), ...] -> {k: {v, ...}} """
+    result = defaultdict(set)
+    for k, v in values_list:
+        result[k].add(v)
+    return result
+
+
+def precompute_batch(user_ids):
+    """
+    预计算一批用户的权限缓存
+    :param user_ids: 用户id列表
+    :return: 处理的用户数
+    """
+    users = list(User.objects.filter(pk__in=user_ids, is_active=True))
+    user_roles = _group_values(UserRoleMapping.objects.filter(
+        user_id__in=user_ids, role__is_deleted=Role.FLAG_EXISTS,
+    ).values_list('user_id', 'role__code'))
+    user_permissions = _group_values(UserPermission.objects.filter(
+        user_id__in=user_ids,
+    ).exclude(permission__status=Permission.STATUS_DISABLE).values_list('user_id', 'permission__code'))
+    relationships = get_user_relationships([u.username for u in users])
+    default_roles = {u.pk: get_relationship_roles(relationships.get(u.username)) for u in users}
+
+    role_codes = set()
+    for codes in (*user_roles.values(), *default_roles.values()):
+        role_codes.update(codes)
+    role_permissions = get_roles_permissions(role_codes)
+    # 超级管理员拥有全部权限，整批只查询一次
+    all_permissions = None
+    if any(u.is_staff and u.is_superuser for u in users):
+        all_permissions = set(Permission.objects.values_list('code', flat=True))
+
+    backend = PermBackend()
+    data = {}
+    for user in users:
+        data[user.username] = backend.build_state(
+            user,
+            default_roles=default_roles[user.pk],
+            user_roles=user_roles.get(user.pk, set()),
+            user_permissions=user_permissions.get(user.pk, set()),
+            role_permissions=role_permissions,
+            all_permissions=all_permissions,
+        )
+    UserCache().bulk_set(data)
+    AuthIndex().index_users({username: state['roles'] for username, state in data.items()})
+    return len(data)
+
+
+def precompute_user_permissions(user_ids=None, batch_size=500, processes=1):
+    """
+    批量预计算激活用户的权限缓存
+    :param user_ids: 需要处理的用户id，默认全部激活用户
+    :param batch_size: 每批处理的用户数
+    :param processes: 并行的进程数，1表示在当前进程中执行（celery worker中只能为1）
+    :return: 处理的用户数
+    """
+    qs = User.objects.filter(is_active=True)
+    if user_ids is not None:
+        qs = qs.filter(pk__in=user_ids)
+    ids = list(qs.order_by('pk').values_list('pk', flat=True))
+    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+    if processes > 1 and len(batches) > 1:
+        # fork前关闭数据库连接，子进程各自重新连接
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            counts = list(executor.map(precompute_batch, batches))
+    else:
+        counts = [precompute_batch(batch) for batch in batches]
+
+    total = sum(counts)
+    logger.info(f'precompute user permissions: {total} users, {len(batches)} batches')
+    return total
@@ -1,3 +1,4 @@
-from .base import get_user_relationship_roles, get_user_relationship
+from .base import get_user_relationship_roles, get_user_relationship, get_relationship_roles, \
+    get_user_relationships
 from .exception import AccessError
 from .http import make_request
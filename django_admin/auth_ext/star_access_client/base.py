@@ -1,24 +1,145 @@
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from .access_config import ROLE_MAPPING
+from .matcher import RoleMatcher
 from .exception import AccessError
 from .http import make_request
-from auth_ext.caches import UserCache
+from auth_ext.caches import RelationshipCache
 
 
 logger = logging.getLogger(__name__)
 
+ROLE_MATCHER = RoleMatcher(ROLE_MAPPING)        # 导入时编译角色映射配置
 
-def get_user_relationship(username):
-    perm_cache = UserCache()
-    data = None
+
+MAX_WORKERS = getattr(settings, 'STAR_ACCESS_MAX_WORKERS', 10)                    # 批量获取用户关系的并发数
+SOFT_TTL = getattr(settings, 'STAR_ACCESS_RELATIONSHIP_SOFT_TTL', 60*60)           # 超过该时间后台刷新（秒）
+NEGATIVE_TTL = getattr(settings, 'STAR_ACCESS_RELATIONSHIP_NEGATIVE_TTL', 60)      # 获取失败的缓存时间（秒）
+
+_refresh_lock = threading.Lock()
+_refreshing = set()                 # 正在后台刷新的用户名
+_refresh_executor = None
+_refresh_executor_pid = None
+
+
+def _fetch_relationship(username):
+    """
+    请求StarAccess获取用户关系
+    :return: (是否成功, 用户关系)
+    """
     try:
-        data = perm_cache.get(username, 'relationship')
-        if not data:
-            data = make_request('api/users/' + username + '/relationship')
-            perm_cache.set(username, 'relationship', data)
+        return True, make_request('api/users/' + username + '/relationship')
     except AccessError as e:
         logger.error(e.message)
-    return data
+    return False, None
+
+
+def _build_entry(ok, data, previous=None):
+    """
+    生成缓存数据，获取失败时保留上次成功的数据继续使用
+    :return: {'data': 用户关系, 'ok': 最近一次获取是否成功, 'fetched_at': 最近一次获取的时间}
+    """
+    if not ok and previous:
+        data = previous.get('data')
+    return {'data': data, 'ok': ok, 'fetched_at': time.time()}
+
+
+def _refresh(username, previous=None):
+    ok, data = _fetch_relationship(username)
+    entry = _build_entry(ok, data, previous)
+    RelationshipCache().set(username, 'data', entry)
+    return entry
+
+
+def _background_refresh(username, previous):
+    try:
+        _refresh(username, previous)
+    except Exception as e:
+        logger.exception(e)
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(username)
+
+
+def _schedule_refresh(username, previous):
+    """ 后台刷新用户关系，同一用户同时只有一个刷新任务 """
+    global _refresh_executor, _refresh_executor_pid
+    with _refresh_lock:
+        if username in _refreshing:
+            return
+        if _refresh_executor is None or _refresh_executor_pid != os.getpid():
+            _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='star-access-refresh')
+            _refresh_executor_pid = os.getpid()
+            _refreshing.clear()
+        _refreshing.add(username)
+    _refresh_executor.submit(_background_refresh, username, previous)
+
+
+def _resolve_entry(entry):
+    """
+    判断缓存数据是否可用
+    :return: (是否可直接使用, 是否需要后台刷新)
+    """
+    if not entry:
+        return False, False
+    age = time.time() - entry['fetched_at']
+    if entry['ok']:
+        return True, age > SOFT_TTL
+    if age < NEGATIVE_TTL:
+        # 失败结果短时间内不再请求
+        return True, False
+    # 失败缓存已过期，有旧数据时先返回旧数据
+    return bool(entry.get('data')), True
+
+
+def get_user_relationship(username):
+    """
+    获取用户关系，数据超过SOFT_TTL时返回旧数据并在后台刷新，获取失败的结果缓存NEGATIVE_TTL秒
+    """
+    entry = RelationshipCache().get(username, 'data')
+    usable, stale = _resolve_entry(entry)
+    if not usable:
+        return _refresh(username, entry)['data']
+    if stale:
+        _schedule_refresh(username, entry)
+    return entry['data']
+
+
+def get_user_relationships(usernames, max_workers=None, refresh_stale=True):
+    """
+    批量获取用户关系，缓存通过一次pipeline读取，未命中的用户通过线程池并发请求StarAccess
+    :param usernames: 用户名列表
+    :param max_workers: 并发数
+    :param refresh_stale: 是否同步刷新过期的数据，批量任务中通常需要最新数据
+    :return: {username: relationship}, 获取失败的用户值为None
+    """
+    usernames = set(usernames)
+    cache = RelationshipCache()
+    entries = cache.get_many_keys(usernames, 'data')
+
+    result = {}
+    missing = []
+    for username, entry in entries.items():
+        usable, stale = _resolve_entry(entry)
+        if usable and not (stale and refresh_stale):
+            result[username] = entry['data']
+        else:
+            missing.append(username)
+    if not missing:
+        return result
+
+    max_workers = min(max_workers or MAX_WORKERS, len(missing))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = dict(zip(missing, executor.map(_fetch_relationship, missing)))
+
+    new_entries = {u: _build_entry(ok, data, entries.get(u)) for u, (ok, data) in fetched.items()}
+    cache.bulk_set({u: {'data': entry} for u, entry in new_entries.items()})
+    result.update({u: entry['data'] for u, entry in new_entries.items()})
+    return result
 
 
 def get_relationship_values(relationship, key):
@@ -68,11 +189,11 @@ def check_role_config(role_code, relationship):
     return False
 
 
+def get_relationship_roles(relationship):
+    """ 获取用户关系映射的lms角色 """
+    return ROLE_MATCHER.match(relationship)
+
+
 def get_user_relationship_roles(username):
     relation_data = get_user_relationship(username)
-    role_set = set()
-    # 遍历角色映射表，获取用户关系映射的lms角色
-    for role_code in ROLE_MAPPING.keys():
-        if check_role_config(role_code, relation_data):
-            role_set.add(role_code)
-    return role_set
+    return get_relationship_roles(relation_data)
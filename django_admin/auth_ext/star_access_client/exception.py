@@ -1,2 +1,3 @@
 class AccessError(Exception):
     response = None
+    message = ''
@@ -1,11 +1,145 @@
 import json
+import os
+import threading
+import time
 
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
-from requests import request, HTTPError
+from requests import Session, HTTPError, ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
+from retrying import retry
+from core_ext.metrics import observe
 from .exception import AccessError
 
 
+CONNECT_TIMEOUT = getattr(settings, 'STAR_ACCESS_CONNECT_TIMEOUT', 3)       # 连接超时（秒）
+READ_TIMEOUT = getattr(settings, 'STAR_ACCESS_READ_TIMEOUT', 10)            # 读取超时（秒）
+MAX_ATTEMPTS = getattr(settings, 'STAR_ACCESS_MAX_ATTEMPTS', 3)             # 最大请求次数（含重试）
+TOTAL_TIMEOUT = getattr(settings, 'STAR_ACCESS_TOTAL_TIMEOUT', 20)          # 包括重试在内的总超时（秒）
+POOL_SIZE = getattr(settings, 'STAR_ACCESS_POOL_SIZE', 20)                  # 连接池大小
+
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def get_session():
+    """ 获取保持长连接的Session，进程内共享，fork后的子进程重新创建 """
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session, _session_pid = session, os.getpid()
+    return _session
+
+
+class CircuitBreaker(object):
+    """
+    熔断器，进程内生效
+    连续失败failure_threshold次后熔断，recovery_timeout秒内的请求直接失败；
+    之后放行一个试探请求，成功则恢复，失败则继续熔断
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """ 是否允许发起请求 """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+circuit_breaker = CircuitBreaker(
+    failure_threshold=getattr(settings, 'STAR_ACCESS_BREAKER_THRESHOLD', 5),
+    recovery_timeout=getattr(settings, 'STAR_ACCESS_BREAKER_TIMEOUT', 30),
+)
+
+
+def _is_retryable(exception):
+    """
+    连接失败（包括连接超时）和服务端5xx错误重试；
+    读取超时不重试，服务端可能仍在处理，重试只会成倍延长同步请求的等待时间
+    """
+    if isinstance(exception, ConnectionError):
+        return True
+    if isinstance(exception, HTTPError) and exception.response is not None:
+        return exception.response.status_code >= 500
+    return False
+
+
+@retry(stop_max_attempt_number=MAX_ATTEMPTS, stop_max_delay=TOTAL_TIMEOUT * 1000, retry_on_exception=_is_retryable,
+       wait_exponential_multiplier=100, wait_exponential_max=1000)
+def _send_with_retry(method, url, data, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise Timeout('StarAccess request deadline exceeded')
+    timeout = (min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+    response = get_session().request(method, url, data=data, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def _send(method, url, data):
+    """ 发送请求，全部重试的总耗时不超过TOTAL_TIMEOUT """
+    return _send_with_retry(method, url, data, time.monotonic() + TOTAL_TIMEOUT)
+
+
+def _guarded_send(method, url, data):
+    """ 经过熔断器的请求，只有网络错误和服务端错误计入熔断 """
+    if not circuit_breaker.allow():
+        observe('lms_star_access_request_duration_seconds', 0, {'method': method, 'outcome': 'circuit_open'})
+        error = AccessError()
+        error.message = 'StarAccess circuit breaker is open'
+        raise error
+    start = time.perf_counter()
+    try:
+        response = _send(method, url, data)
+    except Exception as e:
+        if _is_retryable(e) or isinstance(e, Timeout):
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_success()
+        observe('lms_star_access_request_duration_seconds', time.perf_counter() - start,
+                {'method': method, 'outcome': 'error'})
+        raise
+    circuit_breaker.record_success()
+    observe('lms_star_access_request_duration_seconds', time.perf_counter() - start,
+            {'method': method, 'outcome': 'ok'})
+    return response
+
+
 def make_request(uri, method="GET", **kwargs):
     """
     Make request to star access server
@@ -19,8 +153,7 @@ def make_request(uri, method="GET", **kwargs):
     )
 
     try:
-        response = request(method, url, data=kwargs.get('parm', ''), timeout=20)
-        response.raise_for_status()
+        response = _guarded_send(method, url, kwargs.get('parm', ''))
 
         result = json.loads(response.content)
         if result.get('code') != 0:
@@ -46,4 +179,3 @@ def make_request(uri, method="GET", **kwargs):
         error = AccessError()
         error.message = str(e)
         raise error
-
@@ -0,0 +1,64 @@
+"""
+    角色映射配置的编译匹配器
+    ROLE_MAPPING中每个config编译为一个子句，子句内的每个关系类型(key)占一个二进制位，全部位的组合为子句的掩码；
+    同时建立倒排索引 (key, value) -> [(子句下标, key位), ...]。
+    匹配时只需遍历一遍用户关系数据，每个命中的(key, name)把对应子句的key位置1，子句的位与掩码相等即子句成立，
+    角色的任意一个子句成立即拥有该角色。语义与base.check_role_config一致。
+"""
+from collections import defaultdict
+
+
+class RoleMatcher(object):
+
+    def __init__(self, role_mapping):
+        self.clause_roles = []                  # 子句下标 -> 角色code
+        self.clause_masks = []                  # 子句下标 -> 掩码
+        self.index = defaultdict(list)          # (key, value) -> [(子句下标, key位)]
+        self.keys = set()                       # 所有用到的关系类型
+        self.always_roles = set()               # 空配置，所有人都拥有的角色
+
+        for role_code, configs in role_mapping.items():
+            for config in configs:
+                self._compile_clause(role_code, config)
+        self.index = dict(self.index)
+
+    def _compile_clause(self, role_code, config):
+        clause_id = len(self.clause_roles)
+        mask = 0
+        for bit, (key, values) in enumerate(config.items()):
+            if not isinstance(values, (set, list, tuple)):
+                values = {values}
+            key_bit = 1 << bit
+            mask |= key_bit
+            self.keys.add(key)
+            for value in set(values):
+                self.index.setdefault((key, value), []).append((clause_id, key_bit))
+
+        self.clause_roles.append(role_code)
+        self.clause_masks.append(mask)
+        if mask == 0:
+            self.always_roles.add(role_code)
+
+    def match(self, relationship):
+        """
+        获取用户关系满足的所有角色
+        :param relationship: 用户关系
+        :return: 角色code集合
+        """
+        roles = set(self.always_roles)
+        if not relationship:
+            # StarAccess系统不存在的用户relationship为空，但仍可以满足配置为空的角色
+            return roles
+
+        satisfied = {}
+        for key in self.keys:
+            for item in relationship.get(key) or ():
+                if not isinstance(item, dict) or 'name' not in item:
+                    continue
+                for clause_id, key_bit in self.index.get((key, item['name']), ()):
+                    satisfied[clause_id] = satisfied.get(clause_id, 0) | key_bit
+
+        for clause_id, bits in satisfied.items():
+            if bits == self.clause_masks[clause_id]:
+                roles.add(self.clause_roles[clause_id])
+        return roles
@@ -0,0 +1,8 @@
+from celery import shared_task
+from auth_ext.precompute import precompute_user_permissions
+
+
+@shared_task(ignore_result=True)
+def precompute_permissions_task(user_ids=None, batch_size=500):
+    """ 批量预计算用户权限缓存，celery worker为守护进程无法再创建进程池，故不支持多进程 """
+    return precompute_user_permissions(user_ids=user_ids, batch_size=batch_size, processes=1)
@@ -0,0 +1,90 @@
+from unittest import mock
+from django.db import transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+from auth_ext.api.views import UserOwnMenu
+from auth_ext.models import Permission, Role, get_roles_permissions
+
+
+class FakeRoleCache(object):
+    """ 以dict代替Redis的RoleCache """
+    data = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_many_keys(self, keys, field):
+        return {key: self.data.get(key, {}).get(field) for key in keys}
+
+    def bulk_set(self, data):
+        for key, mapping in data.items():
+            self.data.setdefault(key, {}).update(mapping)
+
+    def clear(self, key):
+        self.data.pop(key, None)
+
+
+class RolePermissionCacheTestCase(TransactionTestCase):
+    """ 角色权限修改后的缓存清除，需要真实提交事务以触发on_commit """
+
+    def setUp(self):
+        FakeRoleCache.data = {}
+        cache_patcher = mock.patch('auth_ext.models.role.RoleCache', FakeRoleCache)
+        index_patcher = mock.patch('auth_ext.models.role.AuthIndex')
+        cache_patcher.start()
+        self.auth_index = index_patcher.start().return_value
+        self.addCleanup(cache_patcher.stop)
+        self.addCleanup(index_patcher.stop)
+
+        self.perm_a = Permission.objects.create(code='test.view_a')
+        self.perm_b = Permission.objects.create(code='test.view_b')
+        self.role = Role.objects.create(name='test')
+        self.role._set_permission_ids([self.perm_a.pk])
+
+    def test_clean_cache_on_commit(self):
+        role_code = self.role.code
+        self.assertEqual(get_roles_permissions([role_code]), {role_code: {'test.view_a'}})
+
+        cache_cleared = []
+        # 清除用户缓存时角色缓存须已清除，否则用户缓存会从旧的角色缓存重建
+        self.auth_index.reset_mock()
+        self.auth_index.invalidate_roles.side_effect = \
+            lambda codes: cache_cleared.append(role_code not in FakeRoleCache.data)
+
+        with transaction.atomic():
+            self.role._set_permission_ids([self.perm_b.pk])
+            # 提交前并发请求读到旧数据并重建角色缓存
+            FakeRoleCache().bulk_set({role_code: {'permissions': {'test.view_a'}}})
+            self.auth_index.invalidate_roles.assert_not_called()
+
+        self.assertEqual(cache_cleared, [True])
+        self.assertEqual(get_roles_permissions([role_code]), {role_code: {'test.view_b'}})
+
+
+@mock.patch('auth_ext.api.views.get_menu_payload_for_user', return_value=('"menu-v1"', b'[]'))
+class UserOwnMenuETagTestCase(SimpleTestCase):
+    """ 菜单接口的条件请求 """
+
+    def get(self, if_none_match=None):
+        headers = {'HTTP_IF_NONE_MATCH': if_none_match} if if_none_match else {}
+        request = APIRequestFactory().get('/api/auth/own/menu/', **headers)
+        force_authenticate(request, user=mock.Mock(is_authenticated=True))
+        return UserOwnMenu.as_view()(request)
+
+    def test_without_validator(self, _):
+        resp = self.get()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, b'[]')
+        self.assertEqual(resp['ETag'], '"menu-v1"')
+
+    def test_strong_validator(self, _):
+        self.assertEqual(self.get('"menu-v1"').status_code, 304)
+        self.assertEqual(self.get('"menu-v0"').status_code, 200)
+
+    def test_weak_validator(self, _):
+        # 经nginx gzip压缩后客户端回传的是弱ETag
+        resp = self.get('W/"menu-v1"')
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], '"menu-v1"')
+        self.assertEqual(self.get('W/"menu-v0", "menu-v1"').status_code, 304)
+        self.assertEqual(self.get('*').status_code, 304)
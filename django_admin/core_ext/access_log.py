@@ -0,0 +1,262 @@
+"""
+    异步批量日志
+    请求线程只把精简的记录放入有界内存队列，后台线程批量格式化（json序列化、时间格式化）后写入日志输出端，
+    队列满时直接丢弃并计数，不阻塞请求；输出端写入失败时写入本地备用文件。
+
+    配置（均可不配置）:
+    ACCESS_LOG = {
+        'SINK': 'logger',                   # 输出端: logger 或 kafka
+        'LOGGER': 'access_log',             # SINK为logger时的logger名称
+        'KAFKA_HOSTS': '127.0.0.1:9092',    # SINK为kafka时的kafka地址
+        'KAFKA_TOPIC': 'access_log',        # SINK为kafka时的topic
+        'FALLBACK_FILE': None,              # 输出端写入失败时的备用文件，不配置则丢弃
+        'QUEUE_SIZE': 10000,                # 队列容量
+        'BATCH_SIZE': 500,                  # 每批最大写入条数
+        'FLUSH_INTERVAL': 1,                # 最长写入间隔（秒）
+        'TIME_ZONE': None,                  # action_time的时区，默认为settings.TIME_ZONE
+    }
+    action_time的时区偏移跟随settings.TIME_ZONE（当前为UTC，输出+00:00），
+    日志消费方需要原来的+08:00时配置 'TIME_ZONE': 'Asia/Shanghai'
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+import pytz
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG = getattr(settings, 'ACCESS_LOG', {})
+
+
+class LoggerSink(object):
+    """ 写入python logger """
+
+    def __init__(self, logger_name):
+        self.logger = logging.getLogger(logger_name)
+
+    def write(self, lines):
+        for line in lines:
+            self.logger.info(line)
+
+
+class KafkaSink(object):
+    """ 写入kafka，producer在写入线程中延迟创建 """
+
+    def __init__(self, hosts, topic):
+        self.hosts = hosts
+        self.topic = topic
+        self._producer = None
+
+    def get_producer(self):
+        if self._producer is None:
+            from pykafka import KafkaClient
+            client = KafkaClient(hosts=self.hosts)
+            self._producer = client.topics[self.topic].get_producer(linger_ms=100)
+        return self._producer
+
+    def write(self, lines):
+        try:
+            producer = self.get_producer()
+            for line in lines:
+                producer.produce(line.encode('utf8'))
+        except Exception:
+            # 连接异常时重建producer
+            self._producer = None
+            raise
+
+
+class FileSink(object):
+    """ 追加写入本地文件 """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, lines):
+        with open(self.path, 'a', encoding='utf8') as f:
+            f.write(''.join(f'{line}\n' for line in lines))
+
+
+class BackgroundLogWriter(object):
+    """
+    后台批量写日志
+    :param sink: 输出端，实现write(lines)方法
+    :param formatter: 记录格式化函数，在写入线程中执行，record -> str
+    :param fallback: 输出端写入失败时的备用输出端
+    """
+
+    def __init__(self, sink, formatter=json.dumps, fallback=None, queue_size=10000, batch_size=500,
+                 flush_interval=1, name='log-writer'):
+        self.sink = sink
+        self.formatter = formatter
+        self.fallback = fallback
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = {'written': 0, 'dropped': 0, 'fallback': 0, 'errors': 0}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def put(self, record):
+        """
+        放入记录，不阻塞
+        :return: 队列已满被丢弃时返回False
+        """
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.counters['dropped'] += 1
+            return False
+        return True
+
+    def stats(self):
+        return dict(self.counters, queued=self.queue.qsize())
+
+    def flush(self):
+        """ 同步写出队列中的全部记录，用于进程退出 """
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _ensure_started(self):
+        """ 启动写入线程，fork后的子进程会重新启动 """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is None:
+                atexit.register(self.flush)
+            # fork前的队列中的记录由父进程负责写出；_pid最后设置，
+            # 否则其他线程会在新队列替换前通过上面的检查，把记录放入随后被丢弃的旧队列
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _drain(self, block=True):
+        """ 取出一批记录，block为True时最多等待flush_interval秒 """
+        batch = []
+        try:
+            if block:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter(record))
+            except Exception as e:
+                self.counters['errors'] += 1
+                logger.error(f'{self.name} format error: {e}')
+        if not lines:
+            return
+
+        try:
+            self.sink.write(lines)
+            self.counters['written'] += len(lines)
+            return
+        except Exception as e:
+            self.counters['errors'] += 1
+            logger.error(f'{self.name} sink error: {e}')
+
+        if self.fallback is not None:
+            try:
+                self.fallback.write(lines)
+                self.counters['fallback'] += len(lines)
+                return
+            except Exception as e:
+                logger.error(f'{self.name} fallback error: {e}')
+        self.counters['dropped'] += len(lines)
+
+    def _run(self):
+        while True:
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+
+
+# ============================================= 访问日志 ==============================================
+_log_tz = pytz.timezone(ACCESS_LOG.get('TIME_ZONE') or settings.TIME_ZONE)
+
+
+def format_time(timestamp):
+    """ 时间戳格式化为带时区的ISO时间，如 2020-01-01T08:00:00+08:00 """
+    return datetime.fromtimestamp(timestamp, _log_tz).isoformat(timespec='seconds')
+
+
+def format_access_log(record):
+    name, sid, uri, timestamp = record
+    return json.dumps({
+        'name': name,
+        'sid': sid,
+        'action_time': format_time(timestamp),
+        'uri': uri,
+        'system': 'new_lms',
+    })
+
+
+def _build_sink():
+    if ACCESS_LOG.get('SINK') == 'kafka':
+        return KafkaSink(ACCESS_LOG['KAFKA_HOSTS'], ACCESS_LOG['KAFKA_TOPIC'])
+    return LoggerSink(ACCESS_LOG.get('LOGGER', 'access_log'))
+
+
+def _build_fallback():
+    path = ACCESS_LOG.get('FALLBACK_FILE')
+    return FileSink(path) if path else None
+
+
+access_log_writer = BackgroundLogWriter(
+    _build_sink(),
+    formatter=format_access_log,
+    fallback=_build_fallback(),
+    queue_size=ACCESS_LOG.get('QUEUE_SIZE', 10000),
+    batch_size=ACCESS_LOG.get('BATCH_SIZE', 500),
+    flush_interval=ACCESS_LOG.get('FLUSH_INTERVAL', 1),
+    name='access-log-writer',
+)
+
+
+def add_access_log(name, sid, uri):
+    """ 记录访问日志，只在请求线程中入队，格式化和写入由后台线程完成 """
+    access_log_writer.put((name, sid, uri, time.time()))
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_log_writer(logger_name, formatter=json.dumps):
+    """ 获取写入指定logger的后台写日志对象，同一logger共用一个写入线程 """
+    writer = _writers.get(logger_name)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(logger_name)
+            if writer is None:
+                writer = BackgroundLogWriter(
+                    LoggerSink(logger_name),
+                    formatter=formatter,
+                    fallback=_build_fallback(),
+                    queue_size=ACCESS_LOG.get('QUEUE_SIZE', 10000),
+                    batch_size=ACCESS_LOG.get('BATCH_SIZE', 500),
+                    flush_interval=ACCESS_LOG.get('FLUSH_INTERVAL', 1),
+                    name=f'{logger_name}-writer',
+                )
+                _writers[logger_name] = writer
+    return writer
@@ -0,0 +1,128 @@
+import re
+from django.apps import apps
+from django.core.management import BaseCommand
+from django.db import connections
+from core_ext.soft_delete import BaseSoftDeletableModel
+
+
+# 各数据库EXPLAIN输出中表示全表扫描的标记；SQLite 3.36起输出 SCAN <表名>，之前为 SCAN TABLE <表名>，
+# 带USING的是索引扫描
+FULL_SCAN_MARKERS = {
+    'mysql': lambda line: 'ALL' in line.split(),
+    'postgresql': lambda line: 'Seq Scan' in line,
+    'sqlite': lambda line: re.search(r'\bSCAN (TABLE )?\S+', line) is not None and 'USING' not in line,
+}
+
+
+def _mysql_plan_rows(plan):
+    """ EXPLAIN列: id select_type table partitions type possible_keys key key_len ref rows filtered Extra """
+    try:
+        columns = plan.splitlines()[0].split()
+        return int(float(columns[9]) * float(columns[10]) / 100)
+    except (IndexError, ValueError):
+        return None
+
+
+def _postgresql_plan_rows(plan):
+    """ 最外层节点的rows估计值 """
+    match = re.search(r'rows=(\d+)', plan)
+    return int(match.group(1)) if match else None
+
+
+# 从EXPLAIN输出中获取查询命中行数的估计值
+PLAN_ROWS = {
+    'mysql': _mysql_plan_rows,
+    'postgresql': _postgresql_plan_rows,
+}
+
+# 数据库统计信息中的表行数估计值
+TABLE_ROWS_SQL = {
+    'mysql': 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+    'postgresql': 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+}
+
+
+def estimate_table_rows(connection, table):
+    """ 表行数估计值，不需要全表扫描；数据库不支持或未收集统计信息时返回None """
+    sql = TABLE_ROWS_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    # PostgreSQL未ANALYZE的表reltuples为-1
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class Command(BaseCommand):
+    help = '通过EXPLAIN检查所有逻辑删除model的逻辑存在/逻辑删除查询是否走索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='只检查指定的model，如 auth_ext.Role')
+        parser.add_argument('--database', default='default', help='数据库别名')
+        parser.add_argument('--min-rows', type=int, default=10000, help='行数少于该值的表不报告全表扫描')
+        parser.add_argument('--max-selectivity', type=float, default=0.3,
+                            help='查询条件命中的行数占比超过该值时，全表扫描是合理的执行计划，不报告')
+        parser.add_argument('--exact', action='store_true',
+                            help='使用COUNT(*)统计精确行数（会扫描全表），默认使用数据库统计信息和执行计划中的估计值')
+        parser.add_argument('--verbose-plan', action='store_true', help='输出完整的执行计划')
+
+    def get_models(self, labels):
+        if labels:
+            return [apps.get_model(label) for label in labels]
+        return [
+            model for model in apps.get_models()
+            if issubclass(model, BaseSoftDeletableModel) and not model._meta.proxy
+        ]
+
+    def handle(self, *args, **options):
+        database = options['database']
+        connection = connections[database]
+        is_full_scan = FULL_SCAN_MARKERS.get(connection.vendor)
+        if is_full_scan is None:
+            print(f'unsupported database: {connection.vendor}')
+            return
+        plan_rows = PLAN_ROWS.get(connection.vendor, lambda plan: None)
+
+        slow_count = 0
+        for model in self.get_models(options['models']):
+            if options['exact']:
+                total = model.all_objects.using(database).count()
+            else:
+                total = estimate_table_rows(connection, model._meta.db_table)
+            for manager_name in ('objects', 'trashes'):
+                qs = getattr(model, manager_name).using(database).all()
+                plan = qs.explain()
+                full_scan = any(is_full_scan(line) for line in plan.splitlines())
+                matched = qs.count() if options['exact'] else plan_rows(plan)
+
+                if total is None or matched is None:
+                    # 没有行数估计值时只能根据执行计划判断
+                    rows = 'rows: unknown, use --exact'
+                    status = 'FULL SCAN' if full_scan else 'OK'
+                else:
+                    selectivity = min(matched / total, 1) if total else 0
+                    rows = f'rows: {matched}/{total} ({selectivity:.1%})'
+                    if not full_scan:
+                        status = 'OK'
+                    elif total < options['min_rows']:
+                        status = 'SMALL TABLE'
+                    elif selectivity > options['max_selectivity']:
+                        # 条件命中大部分行时，索引无法减少扫描的行数
+                        status = 'NOT SELECTIVE'
+                    else:
+                        status = 'FULL SCAN'
+                if status == 'FULL SCAN':
+                    slow_count += 1
+                print(f'[{status}] {model._meta.label}.{manager_name} {rows}')
+                if status == 'FULL SCAN' or options['verbose_plan']:
+                    print(f'    sql: {qs.query}')
+                    print('\n'.join(f'    {line}' for line in plan.splitlines()))
+
+        if slow_count:
+            print(f'{slow_count} soft-delete predicates use full table scan, '
+                  f'check the index on soft_delete_field.')
+        print('Queries combining the soft-delete predicate with other filters need composite indexes, '
+              'declare them in soft_delete_indexes.')
@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management import BaseCommand
+from core_ext.soft_delete.purge import purge_trash
+from core_ext.tasks import purge_trash_task
+
+
+class Command(BaseCommand):
+    help = '物理删除超过保留期限的逻辑删除数据'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='只清理指定的model，如 auth_ext.Role')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批删除的行数')
+        parser.add_argument('--throttle', type=float, default=0.1, help='批次之间的休眠时间（秒）')
+        parser.add_argument('--max-rows', type=int, default=None, help='每个model最多删除的行数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计待删除的行数')
+        parser.add_argument('--async', action='store_true', dest='use_celery', help='发送celery任务异步执行')
+
+    def handle(self, *args, **options):
+        if options['use_celery']:
+            purge_trash_task.delay(
+                model_labels=options['models'] or None,
+                batch_size=options['batch_size'],
+                throttle=options['throttle'],
+                max_rows=options['max_rows'],
+            )
+            print('task sent')
+            return
+
+        models = [apps.get_model(label) for label in options['models']] or None
+        result = purge_trash(
+            models,
+            batch_size=options['batch_size'],
+            throttle=options['throttle'],
+            max_rows=options['max_rows'],
+            dry_run=options['dry_run'],
+        )
+        for label, count in result.items():
+            print(f'{label}: {count}')
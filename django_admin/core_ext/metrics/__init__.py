@@ -0,0 +1,16 @@
+"""
+    接口性能指标
+
+    配置（均可不配置）:
+    METRICS = {
+        'ENABLED': True,                # 是否启用MetricsMiddleware
+        'MULTIPROC_DIR': None,          # 多进程快照目录，gunicorn多worker部署时配置，启动前需清空
+        'FLUSH_INTERVAL': 5,            # 快照写入间隔（秒）
+        'BUCKETS': (0.005, ..., 10),    # 直方图分桶（秒）
+        'TOKEN': None,                  # 采集接口的Bearer token
+        'ALLOWED_IPS': (),              # 允许直接访问采集接口的IP
+    }
+    未配置TOKEN和ALLOWED_IPS时，采集接口只允许已登录的管理员访问
+"""
+from .instruments import get_redis_connection, instrument_redis
+from .registry import inc, observe, collect, registry
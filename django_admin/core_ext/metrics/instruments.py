@@ -0,0 +1,105 @@
+"""
+    数据库、Redis的调用统计
+    * 数据库: 请求内通过connection.execute_wrapper统计每个连接的查询次数和耗时
+    * Redis: get_redis_connection返回的客户端替换execute_command和pipeline.execute，统计往返次数、命令数和耗时
+    请求内的统计累加到当前请求的RequestStats中，由MetricsMiddleware按接口汇总
+"""
+import contextvars
+import time
+from django_redis import get_redis_connection as _get_redis_connection
+from .registry import inc, observe
+
+
+_request_stats = contextvars.ContextVar('lms_metrics_request_stats', default=None)
+
+
+class RequestStats(object):
+    """ 单个请求的调用统计 """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0
+        self.redis_calls = 0
+
+
+def get_request_stats():
+    return _request_stats.get()
+
+
+def activate():
+    return _request_stats.set(RequestStats())
+
+
+def deactivate(token):
+    _request_stats.reset(token)
+
+
+class QueryTimer(object):
+    """ 数据库查询统计，通过connection.execute_wrapper注册 """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            observe('lms_db_query_duration_seconds', duration, {'alias': self.alias})
+            stats = get_request_stats()
+            if stats is not None:
+                stats.db_queries += 1
+                stats.db_seconds += duration
+
+
+def _record_redis_call(alias, command, commands, duration):
+    inc('lms_redis_calls_total', {'alias': alias, 'command': command})
+    inc('lms_redis_commands_total', {'alias': alias}, commands)
+    observe('lms_redis_call_duration_seconds', duration, {'alias': alias})
+    stats = get_request_stats()
+    if stats is not None:
+        stats.redis_calls += 1
+
+
+def _instrument_pipeline(pipe, alias):
+    execute = pipe.execute
+
+    def instrumented_execute(*args, **kwargs):
+        commands = len(pipe.command_stack)
+        start = time.perf_counter()
+        try:
+            return execute(*args, **kwargs)
+        finally:
+            _record_redis_call(alias, 'PIPELINE', commands, time.perf_counter() - start)
+
+    pipe.execute = instrumented_execute
+    return pipe
+
+
+def instrument_redis(client, alias):
+    """ 统计redis客户端的调用，django_redis复用客户端对象，每个客户端只处理一次 """
+    if getattr(client, '_lms_metrics_alias', None) is not None:
+        return client
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def instrumented_execute_command(*args, **options):
+        start = time.perf_counter()
+        try:
+            return execute_command(*args, **options)
+        finally:
+            _record_redis_call(alias, str(args[0]).upper(), 1, time.perf_counter() - start)
+
+    def instrumented_pipeline(*args, **kwargs):
+        return _instrument_pipeline(pipeline(*args, **kwargs), alias)
+
+    client.execute_command = instrumented_execute_command
+    client.pipeline = instrumented_pipeline
+    client._lms_metrics_alias = alias
+    return client
+
+
+def get_redis_connection(alias='default', write=True):
+    """ 同django_redis.get_redis_connection，返回的客户端会统计调用 """
+    return instrument_redis(_get_redis_connection(alias, write), alias)
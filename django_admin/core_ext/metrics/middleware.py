@@ -0,0 +1,47 @@
+import time
+from contextlib import ExitStack
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from .instruments import QueryTimer, activate, deactivate, get_request_stats
+from .registry import METRICS, inc, observe
+
+
+class MetricsMiddleware(object):
+    """
+    接口指标统计中间件，需放在MIDDLEWARE的最前面
+    按 (请求方法, 路由) 统计请求数、耗时直方图，以及请求内的数据库查询次数/耗时和Redis往返次数；
+    路由使用url配置中的路由模板（如 api/auth/users/<int:pk>/），避免标签数量无限增长
+    """
+    def __init__(self, get_response):
+        if not METRICS.get('ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def get_route(self, request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            return '<unmatched>'
+        return getattr(resolver_match, 'route', None) or resolver_match.view_name or '<unknown>'
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        token = activate()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(QueryTimer(connection.alias)))
+                response = self.get_response(request)
+            stats = get_request_stats()
+        finally:
+            deactivate(token)
+
+        route = self.get_route(request)
+        labels = {'method': request.method, 'route': route}
+        observe('lms_http_request_duration_seconds', time.perf_counter() - start, labels)
+        inc('lms_http_requests_total', dict(labels, status=response.status_code))
+        if stats.db_queries:
+            inc('lms_http_db_queries_total', {'route': route}, stats.db_queries)
+            inc('lms_http_db_query_seconds_total', {'route': route}, stats.db_seconds)
+        if stats.redis_calls:
+            inc('lms_http_redis_calls_total', {'route': route}, stats.redis_calls)
+        return response
@@ -0,0 +1,211 @@
+"""
+    进程内指标注册表及多进程汇总
+    每个进程在内存中累加计数器和直方图；配置MULTIPROC_DIR时，后台线程定时把本进程的快照写入
+    <MULTIPROC_DIR>/<pid>-<随机串>.json，采集接口读取目录下全部快照合并后输出，
+    从而汇总同一台机器上的全部gunicorn worker。已退出进程的快照保留（计数器单调递增），部署启动前需清空该目录。
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from glob import glob
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+METRICS = getattr(settings, 'METRICS', {})
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 指标说明 {name: (类型, 说明)}
+METRIC_DEFINES = {
+    'lms_http_requests_total': ('counter', 'HTTP请求数'),
+    'lms_http_request_duration_seconds': ('histogram', 'HTTP请求耗时'),
+    'lms_http_db_queries_total': ('counter', '各接口的数据库查询次数'),
+    'lms_http_db_query_seconds_total': ('counter', '各接口的数据库查询耗时'),
+    'lms_http_redis_calls_total': ('counter', '各接口的Redis往返次数'),
+    'lms_db_query_duration_seconds': ('histogram', '数据库查询耗时'),
+    'lms_redis_calls_total': ('counter', 'Redis往返次数，pipeline计为一次'),
+    'lms_redis_commands_total': ('counter', 'Redis命令数'),
+    'lms_redis_call_duration_seconds': ('histogram', 'Redis往返耗时'),
+    'lms_star_access_request_duration_seconds': ('histogram', 'StarAccess接口请求耗时'),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class Registry(object):
+    """ 线程安全的计数器和直方图 """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = {}          # {(name, labels): value}
+        self.histograms = {}        # {(name, labels): [各桶计数, 总和, 总数]}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                i = len(self.buckets)
+            histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        """ 可json序列化的快照 """
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(h[0]), h[1], h[2]]
+                               for (name, labels), h in self.histograms.items()],
+            }
+
+    @classmethod
+    def merge(cls, snapshots, buckets=DEFAULT_BUCKETS):
+        """ 合并多个快照，桶配置不一致的快照忽略 """
+        registry = cls(buckets)
+        for snapshot in snapshots:
+            if tuple(snapshot['buckets']) != registry.buckets:
+                continue
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                registry.counters[key] = registry.counters.get(key, 0) + value
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = registry.histograms.get(key)
+                if histogram is None:
+                    histogram = registry.histograms[key] = [[0] * len(counts), 0, 0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+        return registry
+
+    def render(self):
+        """ 输出Prometheus文本格式 """
+        def format_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in items)
+            return '{' + pairs + '}'
+
+        samples = {}
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, []).append(f'{name}{format_labels(labels)} {value}')
+            for (name, labels), (counts, total, count) in self.histograms.items():
+                lines = samples.setdefault(name, [])
+                cumulative = 0
+                for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+        output = []
+        for name in sorted(samples):
+            metric_type, help_text = METRIC_DEFINES.get(name, ('untyped', ''))
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {metric_type}')
+            output.extend(samples[name])
+        return '\n'.join(output) + '\n'
+
+
+class MultiprocessExporter(object):
+    """ 定时把本进程的指标快照写入共享目录，fork后的子进程使用新的文件 """
+
+    def __init__(self, registry, path, interval=5):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.filename = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # fork前累加的数据属于父进程
+                self.registry.counters.clear()
+                self.registry.histograms.clear()
+            self._pid = os.getpid()
+            self.filename = os.path.join(self.path, f'{self._pid}-{uuid.uuid4().hex[:8]}.json')
+            os.makedirs(self.path, exist_ok=True)
+            thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+            thread.start()
+
+    def export(self):
+        """ 原子写入本进程快照 """
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, self.filename)
+
+    def collect(self):
+        """ 读取全部进程的快照并合并 """
+        self.ensure_started()
+        self.export()
+        snapshots = []
+        for filename in glob(os.path.join(self.path, '*.json')):
+            try:
+                with open(filename) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f'metrics snapshot {filename} unreadable: {e}')
+        return Registry.merge(snapshots, self.registry.buckets)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.export()
+            except Exception as e:
+                logger.error(f'metrics export error: {e}')
+
+
+registry = Registry(METRICS.get('BUCKETS', DEFAULT_BUCKETS))
+exporter = MultiprocessExporter(registry, METRICS['MULTIPROC_DIR'], METRICS.get('FLUSH_INTERVAL', 5)) \
+    if METRICS.get('MULTIPROC_DIR') else None
+
+
+def inc(name, labels=None, value=1):
+    if exporter is not None:
+        exporter.ensure_started()
+    registry.inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    if exporter is not None:
+        exporter.ensure_started()
+    registry.observe(name, value, labels)
+
+
+def collect():
+    """ 获取用于输出的注册表，多进程模式下为全部进程的汇总 """
+    if exporter is not None:
+        return exporter.collect()
+    return registry
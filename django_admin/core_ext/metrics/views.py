@@ -0,0 +1,31 @@
+import hmac
+from django.http import HttpResponse, HttpResponseForbidden
+from .registry import METRICS, collect
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def has_metrics_access(request):
+    """
+    采集接口的访问控制，满足任意一项即可访问:
+    * METRICS['TOKEN']: 请求头 Authorization: Bearer <TOKEN>
+    * METRICS['ALLOWED_IPS']: 请求来源IP在列表中
+    * 已登录的管理员用户
+    """
+    token = METRICS.get('TOKEN')
+    if token:
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        if auth.startswith('Bearer ') and hmac.compare_digest(auth[len('Bearer '):], token):
+            return True
+    if request.META.get('REMOTE_ADDR') in METRICS.get('ALLOWED_IPS', ()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+def metrics_view(request):
+    """ Prometheus采集接口，多进程模式下输出全部worker的汇总 """
+    if not has_metrics_access(request):
+        return HttpResponseForbidden()
+    return HttpResponse(collect().render(), content_type=CONTENT_TYPE)
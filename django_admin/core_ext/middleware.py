@@ -1,7 +1,10 @@
-import time
 import json
-import logging
+import random
+import time
+from django.conf import settings
+from django.http.request import RawPostDataException
 from django.utils.deprecation import MiddlewareMixin
+from core_ext.access_log import add_access_log, format_time, get_log_writer
 
 
 class LogMiddleware(MiddlewareMixin):
@@ -10,15 +13,7 @@ class LogMiddleware(MiddlewareMixin):
     def process_request(self, request):
         try:
             if request.session.session_key is not None:
-                data = {
-                    "name": str(request.user),
-                    "sid": request.session.session_key,
-                    "action_time": time.strftime("%Y-%m-%dT%H:%M:%S+08:00", time.localtime()),
-                    "uri": request.path,
-                    "system": "new_lms"
-                }
-                logger = logging.getLogger('access_log')
-                logger.info(msg=json.dumps(data))
+                add_access_log(str(request.user), request.session.session_key, request.path)
         except Exception as e:
             pass
 
@@ -27,17 +22,24 @@ class LogMiddleware(MiddlewareMixin):
 
 
 class OpenAPILogMiddleware(MiddlewareMixin):
-    """ 测试环境OpenAPI接口日志记录 """
+    """
+    测试环境OpenAPI接口日志记录
+    计时保存在每个请求的局部变量中；请求体和响应体按配置截断或抽样，流式响应不读取内容；
+    日志记录交给后台线程格式化和写入。
+
+    配置（均可不配置）:
+    OPENAPI_LOG = {
+        'MAX_REQUEST_BODY': 4096,       # 记录的请求体最大字节数，超出部分截断
+        'MAX_RESPONSE_BODY': 4096,      # 记录的响应体最大字节数，超出部分截断
+        'BODY_SAMPLE_RATE': 1.0,        # 记录请求体和响应体的抽样比例，未抽中的请求只记录大小
+    }
+    """
     def __init__(self, get_response=None):
         super().__init__(get_response)
-        self.start_time = None
-        self.end_time = None
-
-    @property
-    def time_pass(self):
-        if self.start_time is None or self.end_time is None:
-            return -1
-        return (self.end_time - self.start_time) / 1000000
+        config = getattr(settings, 'OPENAPI_LOG', {})
+        self.max_request_body = config.get('MAX_REQUEST_BODY', 4096)
+        self.max_response_body = config.get('MAX_RESPONSE_BODY', 4096)
+        self.body_sample_rate = config.get('BODY_SAMPLE_RATE', 1.0)
 
     def parse_url_path(self, url_path):
         """ 解析url """
@@ -47,12 +49,34 @@ class OpenAPILogMiddleware(MiddlewareMixin):
             return '', ''
         return url_prefix, rest
 
-    def get_logger(self, rest):
-        """ 根据url后缀获取logger """
+    def get_logger_name(self, rest):
+        """ 根据url后缀获取logger名称 """
         _app = rest.strip('/').split('/')[0]
-        logger_name = f'openapi_{_app}'
-        logger = logging.getLogger(logger_name)
-        return logger
+        return f'openapi_{_app}'
+
+    def get_content_length(self, request):
+        try:
+            return int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 0
+
+    def get_request_body(self, request):
+        """ 获取截断后的请求体，超出限制的请求体不读取，避免提前缓冲大文件 """
+        content_length = self.get_content_length(request)
+        if content_length > self.max_request_body:
+            return None, content_length
+        try:
+            body = request.body
+        except RawPostDataException:
+            return None, content_length
+        return body[:self.max_request_body], len(body)
+
+    def get_response_body(self, response):
+        """ 获取截断后的响应体，流式响应不读取 """
+        if response.streaming:
+            return None, None
+        content = response.content
+        return content[:self.max_response_body], len(content)
 
     def __call__(self, request):
         url_prefix, rest = self.parse_url_path(request.path)
@@ -60,38 +84,74 @@ class OpenAPILogMiddleware(MiddlewareMixin):
             return self.get_response(request)
 
         # 记录请求开始时间
-        self.start_time = time.perf_counter_ns()
+        start_time = time.perf_counter_ns()
         # 给request对象添加process_code
-        process_code = str(time.perf_counter_ns())
+        process_code = str(start_time)
         setattr(request, 'process_code', process_code)
-        log_dict = {
+        log_body = self.body_sample_rate >= 1 or random.random() < self.body_sample_rate
+
+        record = {
             'uri': rest,
             'method': request.method,
-            "action_time": time.strftime("%Y-%m-%dT%H:%M:%S+08:00", time.localtime()),
+            'action_time': time.time(),
             'process_code': process_code,
         }
-
         if request.GET:
             # 记录查询参数
-            log_dict['params'] = json.dumps(request.GET.dict(), ensure_ascii=False)
-
-        # 记录body参数
-        if request.body:
-            body_str = request.body.decode('utf8')
-            log_dict['request_body'] = json.dumps(json.loads(body_str), ensure_ascii=False)
-        elif request.POST:
-            log_dict['request_body'] = json.dumps(request.POST.dict(), ensure_ascii=False)
+            record['params'] = request.GET.dict()
+        if log_body:
+            record['request_body'], record['request_size'] = self.get_request_body(request)
+        else:
+            record['request_size'] = self.get_content_length(request)
 
         response = self.get_response(request)
 
-        self.end_time = time.perf_counter_ns()
-        log_dict.update({
-            'time_pass': f'{self.time_pass:.3f}ms',
+        record.update({
+            'time_pass': (time.perf_counter_ns() - start_time) / 1000000,
             'status_code': response.status_code,
-            'response_body': response.content.decode('utf8'),
+            'streaming': response.streaming,
         })
+        if log_body:
+            record['response_body'], record['response_size'] = self.get_response_body(response)
+        elif not response.streaming:
+            record['response_size'] = len(response.content)
 
-        logger = self.get_logger(rest)
-        logger.info(json.dumps(log_dict, ensure_ascii=False))
-
+        get_log_writer(self.get_logger_name(rest), formatter=format_openapi_log).put(record)
         return response
+
+
+def _decode_body(body, size):
+    """ 解码截断后的body，截断位置可能在多字节字符中间 """
+    text = body.decode('utf8', errors='replace')
+    if size > len(body):
+        text += f'...<truncated {size - len(body)} bytes>'
+    return text
+
+
+def format_openapi_log(record):
+    """ 在写入线程中格式化OpenAPI日志 """
+    log_dict = {
+        'uri': record['uri'],
+        'method': record['method'],
+        'action_time': format_time(record['action_time']),
+        'process_code': record['process_code'],
+    }
+    if 'params' in record:
+        log_dict['params'] = json.dumps(record['params'], ensure_ascii=False)
+
+    if record.get('request_body'):
+        log_dict['request_body'] = _decode_body(record['request_body'], record['request_size'])
+    elif record.get('request_size'):
+        log_dict['request_body'] = f'<{record["request_size"]} bytes>'
+
+    log_dict.update({
+        'time_pass': f'{record["time_pass"]:.3f}ms',
+        'status_code': record['status_code'],
+    })
+    if record['streaming']:
+        log_dict['response_body'] = '<streaming>'
+    elif record.get('response_body') is not None:
+        log_dict['response_body'] = _decode_body(record['response_body'], record['response_size'])
+    elif record.get('response_size'):
+        log_dict['response_body'] = f'<{record["response_size"]} bytes>'
+    return json.dumps(log_dict, ensure_ascii=False)
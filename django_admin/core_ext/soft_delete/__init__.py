@@ -1,4 +1,4 @@
-from .base import BaseSoftDeletableModel
+from .base import BaseSoftDeletableModel, chunked_soft_delete, get_soft_delete_progress
 from .boolean_delete import Model as BooleanDeletableModel
 from .datetime_delete import Model as DateTimeDeletableModel
 from .uuid_delete import Model as UUIDDeletableModel
@@ -6,5 +6,8 @@ from .signals import *
 
 __all__ = [
     'BaseSoftDeletableModel', 'BooleanDeletableModel', 'DateTimeDeletableModel', 'UUIDDeletableModel',
-    'pre_soft_delete', 'post_soft_delete', 'pre_restore', 'post_restore',
+    'pre_soft_delete', 'post_soft_delete', 'pre_restore', 'post_restore', 'soft_delete_progress',
+    'pre_bulk_soft_delete', 'post_bulk_soft_delete', 'pre_bulk_restore', 'post_bulk_restore',
+    'pre_hard_delete', 'post_hard_delete', 'pre_bulk_hard_delete', 'post_bulk_hard_delete',
+    'chunked_soft_delete', 'get_soft_delete_progress',
 ]
@@ -1,8 +1,127 @@
 from django.db import models, transaction
+from django.db.backends.utils import names_digest
 from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
 from .signals import *
 
 
+def iter_pk_batches(qs, batch_size, after_pk=None):
+    """
+    按主键顺序分批遍历查询集的主键，使用 pk > 上一批最大pk 翻页，每批只加载batch_size个主键
+    切片后的查询集无法继续过滤，一次取出全部主键后再分批
+    :param after_pk: 只遍历大于该值的主键，用于断点继续
+    """
+    if not qs.query.can_filter():
+        pks = sorted(pk for pk in qs.values_list('pk', flat=True) if after_pk is None or pk > after_pk)
+        for i in range(0, len(pks), batch_size):
+            yield pks[i:i + batch_size]
+        return
+
+    pk_qs = qs.order_by('pk').values_list('pk', flat=True)
+    last_pk = after_pk
+    while True:
+        batch_qs = pk_qs if last_pk is None else pk_qs.filter(pk__gt=last_pk)
+        pks = list(batch_qs[:batch_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def _batch_soft_delete(qs, deleted, pks=None):
+    """
+    逻辑删除/恢复查询集，存在批量信号接收者时按soft_delete_batch_size分批，每批一个事务并发送带主键列表的批量信号
+    :param pks: 查询集对应的主键列表（已分批），未传入且需要发送信号时分批查询
+    :return: 更新的行数
+    """
+    model = qs.model
+    pre_signal, post_signal = (pre_bulk_soft_delete, post_bulk_soft_delete) if deleted \
+        else (pre_bulk_restore, post_bulk_restore)
+    if not pre_signal.has_listeners(model) and not post_signal.has_listeners(model):
+        return model.batch_soft_delete(qs=qs, deleted=deleted)
+
+    if pks is None:
+        count = 0
+        for batch_pks in iter_pk_batches(qs, model.soft_delete_batch_size):
+            batch_qs = model._base_manager.using(qs.db).filter(pk__in=batch_pks)
+            count += _batch_soft_delete(batch_qs, deleted, pks=batch_pks)
+        return count
+
+    if not pks:
+        return 0
+    with transaction.atomic(using=qs.db):
+        pre_signal.send(sender=model, pks=pks, using=qs.db)
+        count = model.batch_soft_delete(qs=qs, deleted=deleted)
+        post_signal.send(sender=model, pks=pks, using=qs.db)
+    return count
+
+
+class SoftDeleteCheckpoint(object):
+    """
+    分批逻辑删除/恢复的断点，保存在缓存中
+    格式为 {'model': model_label, 'deleted': 是否删除, 'last_pk': 最后处理的主键, 'count': 已更新行数, 'finished': 是否完成}
+    """
+    KEY_PROFIT = 'soft_delete:job'
+    TIMEOUT = 7 * 24 * 60 * 60
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.cache_key = f'{self.KEY_PROFIT}:{job_id}'
+        self._cache = caches[getattr(settings, 'SOFT_DELETE_CHECKPOINT_CACHE', 'default')]
+
+    def get(self):
+        return self._cache.get(self.cache_key)
+
+    def save(self, state):
+        self._cache.set(self.cache_key, state, self.TIMEOUT)
+
+
+def chunked_soft_delete(qs, deleted, batch_size=None, job_id=None):
+    """
+    分批逻辑删除/恢复，按主键顺序每批一个事务提交，每批提交后发送soft_delete_progress信号
+    :param qs: 查询集
+    :param deleted: True为逻辑删除，False为恢复
+    :param batch_size: 每批行数，默认为model的soft_delete_batch_size
+    :param job_id: 任务id，指定时每批提交后记录断点，中断后使用相同job_id重新执行会从断点继续
+    :return: 更新的行数（包括断点之前已更新的行数）
+    """
+    model = qs.model
+    batch_size = batch_size or model.soft_delete_batch_size
+    checkpoint = SoftDeleteCheckpoint(job_id) if job_id else None
+    state = checkpoint.get() if checkpoint else None
+    if state is None or state['model'] != model._meta.label or state['deleted'] != deleted:
+        state = {'model': model._meta.label, 'deleted': deleted, 'last_pk': None, 'count': 0, 'finished': False}
+    if state['finished']:
+        return state['count']
+
+    for pks in iter_pk_batches(qs, batch_size, after_pk=state['last_pk']):
+        with transaction.atomic(using=qs.db):
+            state['count'] += _batch_soft_delete(
+                model._base_manager.using(qs.db).filter(pk__in=pks), deleted, pks=pks) or 0
+        state['last_pk'] = pks[-1]
+        if checkpoint is not None:
+            checkpoint.save(state)
+        soft_delete_progress.send(
+            sender=model,
+            deleted=deleted,
+            count=state['count'],
+            last_pk=state['last_pk'],
+            job_id=job_id,
+            using=qs.db,
+        )
+
+    state['finished'] = True
+    if checkpoint is not None:
+        checkpoint.save(state)
+    return state['count']
+
+
+def get_soft_delete_progress(job_id):
+    """ 获取分批逻辑删除/恢复任务的进度，不存在时返回None """
+    return SoftDeleteCheckpoint(job_id).get()
+
+
 class BaseExistQuerySet(models.QuerySet):
     def delete(self, soft=None):
         """
@@ -16,10 +135,15 @@ class BaseExistQuerySet(models.QuerySet):
             super().delete()
         self.soft_delete()
 
-    @transaction.atomic
-    def soft_delete(self):
-        """ 逻辑删除 """
-        self.model.batch_soft_delete(qs=self, deleted=True)
+    def soft_delete(self, chunk_size=None, job_id=None):
+        """
+        逻辑删除，返回删除的行数
+        :param chunk_size: 指定时分批删除，每批一个事务，见chunked_soft_delete
+        :param job_id: 分批删除的任务id，用于断点继续
+        """
+        if chunk_size or job_id:
+            return chunked_soft_delete(self, deleted=True, batch_size=chunk_size, job_id=job_id)
+        return _batch_soft_delete(self, deleted=True)
 
 
 class BaseTrashQuerySet(models.QuerySet):
@@ -35,10 +159,15 @@ class BaseTrashQuerySet(models.QuerySet):
             super().delete()
         self.restore()
 
-    @transaction.atomic
-    def restore(self):
-        """ 将已被逻辑删除的对象恢复 """
-        self.model.queryset_logical_delete(qs=self, deleted=False)
+    def restore(self, chunk_size=None, job_id=None):
+        """
+        将已被逻辑删除的对象恢复，返回恢复的行数
+        :param chunk_size: 指定时分批恢复，每批一个事务，见chunked_soft_delete
+        :param job_id: 分批恢复的任务id，用于断点继续
+        """
+        if chunk_size or job_id:
+            return chunked_soft_delete(self, deleted=False, batch_size=chunk_size, job_id=job_id)
+        return _batch_soft_delete(self, deleted=False)
 
 
 class ExistManager(models.Manager):
@@ -67,6 +196,11 @@ class BaseSoftDeletableModel(models.Model):
         Model层面上控制默认调用delete是否为逻辑删除，即delete方法中soft参数的默认值
     querysets:
         QuerySet提供两种默认的查询集，可自定义实现
+    索引:
+        每个具体model自动为soft_delete_field添加单列索引，只对逻辑删除一侧（trashes、数据清理）这类选择性高的查询有效；
+        逻辑存在一侧的查询需要在soft_delete_indexes中声明常用的查询字段，与soft_delete_field组成联合索引，
+        支持部分索引的数据库（PostgreSQL、SQLite）同时以逻辑存在条件作为索引条件，MySQL忽略该条件，为普通联合索引。
+        可通过 manage.py checksoftdelete 检查
     必须实现的方法：
         * is_soft_deleted(): 判断是否逻辑删除
         * soft_delete(): 实现逻辑删除的方法
@@ -75,6 +209,11 @@ class BaseSoftDeletableModel(models.Model):
     """
     query_param = models.Q()                    # 逻辑存在查询条件
     _soft_delete_flag = True                    # 是否逻辑删除
+    soft_delete_batch_size = 1000               # 批量逻辑删除时每批处理的行数
+    soft_delete_field = None                    # 逻辑删除标记字段，用于自动添加索引
+    soft_delete_indexes = ()                    # 需要与逻辑存在条件组合的常用查询字段，如 [('user', ), ('code', 'name')]
+    trash_retention = None                      # 逻辑删除数据的保留期限（timedelta），None表示不清理
+    trash_time_field = None                     # 逻辑删除时间字段，用于判断是否超过保留期限
 
     _exist_queryset = BaseExistQuerySet         # 逻辑存在查询集
     _trash_queryset = BaseTrashQuerySet         # 逻辑删除查询集
@@ -88,6 +227,17 @@ class BaseSoftDeletableModel(models.Model):
         """ 通过重写该方法实现逻辑关系映射，自定义删除条件等功能 """
         return cls.query_param
 
+    @classmethod
+    def get_expired_trashes(cls, now=None):
+        """
+        超过保留期限的逻辑删除对象，可重写实现自定义的清理条件
+        :return: 查询集，未声明保留期限时返回None
+        """
+        if cls.trash_retention is None or not cls.trash_time_field:
+            return None
+        now = now or timezone.now()
+        return cls.trashes.filter(**{f'{cls.trash_time_field}__lt': now - cls.trash_retention})
+
     @transaction.atomic
     def delete(self, soft=None, using=None, keep_parents=False):
         """ 自定义删除信号要将django删除信号包裹在内 """
@@ -163,9 +313,44 @@ class BaseSoftDeletableModel(models.Model):
         查询集操作
         :param qs: 需要搜索的查询集
         :param deleted: 是否删除
-        :return:
+        :return: 更新的行数
         """
         raise NotImplementedError
 
     class Meta:
         abstract = True
+
+
+def _get_index_name(model, fields, suffix):
+    """ 生成不超过30个字符的索引名称 """
+    table_name = model._meta.db_table
+    return f'{table_name[:16]}_{names_digest(table_name, *fields, length=6)}_{suffix}'
+
+
+def add_soft_delete_indexes(sender, **kwargs):
+    """
+    class_prepared信号处理，为逻辑删除model添加索引
+    django2.2的抽象model中无法声明带model名称占位符的索引名称，故在model加载时动态添加
+    """
+    if not issubclass(sender, BaseSoftDeletableModel):
+        return
+    meta = sender._meta
+    if meta.abstract or meta.proxy or not sender.soft_delete_field:
+        return
+
+    index_names = {index.name for index in meta.indexes}
+    indexes = []
+    field = meta.get_field(sender.soft_delete_field)
+    if not field.db_index and not field.unique:
+        indexes.append(models.Index(fields=[field.name], name=_get_index_name(sender, [field.name], 'sd')))
+    for fields in sender.soft_delete_indexes:
+        fields = [*fields, field.name]
+        indexes.append(models.Index(
+            fields=fields,
+            name=_get_index_name(sender, fields, 'sdx'),
+            condition=sender.get_query_param() or None,
+        ))
+    meta.indexes = [*meta.indexes, *(index for index in indexes if index.name not in index_names)]
+
+
+models.signals.class_prepared.connect(add_soft_delete_indexes)
@@ -5,7 +5,8 @@ from .base import BaseSoftDeletableModel
 
 class Model(BaseSoftDeletableModel):
     is_deleted = models.BooleanField(default=False, editable=False)
-    query_param = models.Q(enable=True)
+    query_param = models.Q(is_deleted=False)
+    soft_delete_field = 'is_deleted'
 
     def is_soft_deleted(self):
         return self.is_deleted
@@ -21,7 +22,7 @@ class Model(BaseSoftDeletableModel):
     @classmethod
     @transaction.atomic
     def batch_soft_delete(cls, qs, deleted, **kwargs):
-        qs.update(is_deleted=deleted)
+        return qs.update(is_deleted=deleted)
 
     class Meta:
         abstract = True
@@ -7,6 +7,8 @@ from .base import BaseSoftDeletableModel
 class Model(BaseSoftDeletableModel):
     delete_at = models.DateTimeField(null=True, editable=False, default=None)
     query_param = models.Q(delete_at__isnull=True)
+    soft_delete_field = 'delete_at'
+    trash_time_field = 'delete_at'
 
     def is_soft_deleted(self):
         return self.delete_at is not None
@@ -23,9 +25,8 @@ class Model(BaseSoftDeletableModel):
     @transaction.atomic
     def batch_soft_delete(cls, qs, deleted, **kwargs):
         if deleted:
-            qs.update(delete_at=timezone.now())
-        else:
-            qs.update(delete_at=None)
+            return qs.update(delete_at=timezone.now())
+        return qs.update(delete_at=None)
 
     class Meta:
         abstract = True
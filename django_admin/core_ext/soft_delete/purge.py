@@ -0,0 +1,80 @@
+"""
+    逻辑删除数据清理
+    model通过trash_retention（timedelta）声明逻辑删除数据的保留期限，通过trash_time_field指定删除时间字段
+    （DateTimeDeletableModel默认为delete_at），超过保留期限的数据按主键分批物理删除，每批一个事务，
+    批次之间休眠以降低对数据库的压力。未声明保留期限的model不会被清理。
+
+    celery beat定时执行示例:
+    CELERY_BEAT_SCHEDULE = {
+        'purge-trash': {
+            'task': 'core_ext.tasks.purge_trash_task',
+            'schedule': crontab(hour=3, minute=0),
+        },
+    }
+"""
+import logging
+import time
+from django.apps import apps
+from django.db import transaction
+from .base import BaseSoftDeletableModel, iter_pk_batches
+from .signals import pre_bulk_hard_delete, post_bulk_hard_delete
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_purgeable_models():
+    """ 声明了保留期限的逻辑删除model """
+    return [
+        model for model in apps.get_models()
+        if issubclass(model, BaseSoftDeletableModel) and not model._meta.proxy
+        and model.get_expired_trashes() is not None
+    ]
+
+
+def purge_model(model, batch_size=500, throttle=0.1, max_rows=None, now=None, dry_run=False):
+    """
+    物理删除一个model超过保留期限的逻辑删除数据
+    :param model: model类
+    :param batch_size: 每批删除的行数
+    :param throttle: 批次之间的休眠时间（秒）
+    :param max_rows: 本次最多删除的行数，None表示不限制
+    :param now: 计算保留期限的当前时间，默认为timezone.now()
+    :param dry_run: 只统计不删除
+    :return: 删除（dry_run时为待删除）的主对象行数
+    """
+    qs = model.get_expired_trashes(now)
+    if qs is None:
+        return 0
+    if dry_run:
+        count = qs.count()
+        return count if max_rows is None else min(count, max_rows)
+
+    count = 0
+    for pks in iter_pk_batches(qs, batch_size):
+        if max_rows is not None:
+            pks = pks[:max_rows - count]
+        with transaction.atomic(using=qs.db):
+            batch_qs = model._base_manager.using(qs.db).filter(pk__in=pks)
+            pre_bulk_hard_delete.send(sender=model, pks=pks, using=qs.db)
+            _, deleted = batch_qs.delete()
+            post_bulk_hard_delete.send(sender=model, pks=pks, using=qs.db)
+        count += deleted.get(model._meta.label, 0)
+        if max_rows is not None and count >= max_rows:
+            break
+        if throttle:
+            time.sleep(throttle)
+    if count:
+        logger.info(f'purged {count} {model._meta.label} trash rows')
+    return count
+
+
+def purge_trash(models=None, **kwargs):
+    """
+    清理多个model超过保留期限的逻辑删除数据，参数见purge_model
+    :param models: model列表，默认为所有声明了保留期限的model
+    :return: {model_label: 行数}
+    """
+    if models is None:
+        models = get_purgeable_models()
+    return {model._meta.label: purge_model(model, **kwargs) for model in models}
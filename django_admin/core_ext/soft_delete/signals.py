@@ -14,3 +14,15 @@ post_hard_delete = Signal(providing_args=['instance'])          # 物理删除
 
 pre_restore = Signal(providing_args=['instance'])               # 逻辑删除恢复前
 post_restore = Signal(providing_args=['instance'])              # 逻辑删除回复后
+
+# 查询集批量操作信号，pks为本次操作的主键列表；只有存在接收者时才会查询主键并发送
+pre_bulk_soft_delete = Signal(providing_args=['pks'])           # 批量逻辑删除前
+post_bulk_soft_delete = Signal(providing_args=['pks'])          # 批量逻辑删除后
+
+pre_bulk_restore = Signal(providing_args=['pks'])               # 批量恢复前
+post_bulk_restore = Signal(providing_args=['pks'])              # 批量恢复后
+
+pre_bulk_hard_delete = Signal(providing_args=['pks'])           # 批量物理删除前（逻辑删除数据清理）
+post_bulk_hard_delete = Signal(providing_args=['pks'])          # 批量物理删除后（逻辑删除数据清理）
+
+soft_delete_progress = Signal(providing_args=['deleted', 'count', 'last_pk', 'job_id'])    # 分批逻辑删除/恢复每批提交后
@@ -1,12 +1,13 @@
-from django.db import models, transaction
+from django.db import models
 import uuid
 
-from .base import BaseSoftDeletableModel
+from .base import BaseSoftDeletableModel, iter_pk_batches
 
 
 class Model(BaseSoftDeletableModel):
     deleted = models.UUIDField(null=True, editable=False, default=None)
     query_param = models.Q(deleted__isnull=True)
+    soft_delete_field = 'deleted'
 
     def is_soft_deleted(self):
         return self.deleted is not None
@@ -20,14 +21,26 @@ class Model(BaseSoftDeletableModel):
         self.save()
 
     @classmethod
-    @transaction.atomic
-    def batch_soft_delete(cls, qs, deleted, **kwargs):
+    def batch_soft_delete(cls, qs, deleted, batch_size=None, **kwargs):
+        """
+        每个对象需要不同的uuid，按主键分批，每批一条 UPDATE ... SET deleted = CASE pk WHEN ... END，
+        每批一条语句单独提交，不在一个长事务中执行；内存占用只与batch_size有关；已删除的对象保持原uuid
+        :param batch_size: 每批更新的行数，默认为soft_delete_batch_size
+        :return: 更新的行数
+        """
         if not deleted:
-            qs.update(deleted=None)
-            return
-        for item in qs:
-            item.deleted = uuid.uuid4()
-            item.save()
+            return qs.update(deleted=None)
+
+        batch_size = batch_size or cls.soft_delete_batch_size
+        if qs.query.can_filter():
+            qs = qs.filter(deleted__isnull=True)
+        count = 0
+        for pks in iter_pk_batches(qs, batch_size):
+            tokens = [models.When(pk=pk, then=models.Value(uuid.uuid4(), output_field=models.UUIDField()))
+                      for pk in pks]
+            count += qs.model._base_manager.using(qs.db).filter(pk__in=pks, deleted__isnull=True).update(
+                deleted=models.Case(*tokens, output_field=models.UUIDField()))
+        return count
 
     class Meta:
         abstract = True
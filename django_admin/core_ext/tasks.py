@@ -0,0 +1,32 @@
+from celery import shared_task
+from django.apps import apps
+from core_ext.soft_delete import chunked_soft_delete
+from core_ext.soft_delete.purge import purge_trash
+
+
+@shared_task(bind=True)
+def chunked_soft_delete_task(self, model_label, filters=None, deleted=True, batch_size=None, job_id=None):
+    """
+    异步分批逻辑删除/恢复
+    :param model_label: model标识，如 auth_ext.Role
+    :param filters: 查询条件，逻辑删除时在逻辑存在的对象中过滤，恢复时在已逻辑删除的对象中过滤
+    :param deleted: True为逻辑删除，False为恢复
+    :param batch_size: 每批行数
+    :param job_id: 断点任务id，默认为celery任务id，任务重试时从断点继续
+    :return: 更新的行数
+    """
+    model = apps.get_model(model_label)
+    manager = model.objects if deleted else model.trashes
+    qs = manager.filter(**(filters or {}))
+    return chunked_soft_delete(qs, deleted, batch_size=batch_size, job_id=job_id or self.request.id)
+
+
+@shared_task
+def purge_trash_task(model_labels=None, batch_size=500, throttle=0.1, max_rows=None):
+    """
+    物理删除超过保留期限的逻辑删除数据，用于celery beat定时执行
+    :param model_labels: model标识列表，默认为所有声明了保留期限的model
+    :return: {model_label: 删除的行数}
+    """
+    models = [apps.get_model(label) for label in model_labels] if model_labels else None
+    return purge_trash(models, batch_size=batch_size, throttle=throttle, max_rows=max_rows)
@@ -0,0 +1,139 @@
+from datetime import timedelta
+from django.db import connection, models
+from django.test import TransactionTestCase
+from django.utils import timezone
+from core_ext.soft_delete import (
+    UUIDDeletableModel, BooleanDeletableModel, DateTimeDeletableModel, chunked_soft_delete,
+    pre_bulk_soft_delete, post_bulk_soft_delete, soft_delete_progress,
+)
+from core_ext.soft_delete.base import iter_pk_batches
+from core_ext.soft_delete.purge import purge_model
+
+
+class UUIDItem(UUIDDeletableModel):
+    name = models.CharField(max_length=32)
+    soft_delete_batch_size = 10
+
+    class Meta:
+        app_label = 'core_ext'
+
+
+class BooleanItem(BooleanDeletableModel):
+    name = models.CharField(max_length=32)
+
+    class Meta:
+        app_label = 'core_ext'
+
+
+class DateTimeItem(DateTimeDeletableModel):
+    name = models.CharField(max_length=32)
+    trash_retention = timedelta(days=30)
+
+    class Meta:
+        app_label = 'core_ext'
+
+
+class SoftDeleteTestCase(TransactionTestCase):
+    """ 逻辑删除查询集操作，core_ext未加入INSTALLED_APPS时测试model的数据表在测试中创建 """
+    test_models = [UUIDItem, BooleanItem, DateTimeItem]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        table_names = connection.introspection.table_names()
+        cls.created_models = [model for model in cls.test_models if model._meta.db_table not in table_names]
+        with connection.schema_editor() as schema_editor:
+            for model in cls.created_models:
+                schema_editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as schema_editor:
+            for model in cls.created_models:
+                schema_editor.delete_model(model)
+        super().tearDownClass()
+
+    def setUp(self):
+        for model in self.test_models:
+            model.objects.bulk_create([model(name=f'item{i}') for i in range(25)])
+
+    def tearDown(self):
+        for model in self.test_models:
+            model.all_objects.all().delete()
+
+    def test_iter_pk_batches(self):
+        pks = list(UUIDItem.all_objects.order_by('pk').values_list('pk', flat=True))
+        batches = list(iter_pk_batches(UUIDItem.objects.all(), 10))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(sum(batches, []), pks)
+
+        # 切片后的查询集
+        batches = list(iter_pk_batches(UUIDItem.objects.order_by('pk')[:12], 5, after_pk=pks[2]))
+        self.assertEqual(sum(batches, []), pks[3:12])
+
+    def test_uuid_soft_delete(self):
+        self.assertEqual(UUIDItem.objects.all().soft_delete(), 25)
+        self.assertEqual(UUIDItem.objects.count(), 0)
+        tokens = list(UUIDItem.trashes.values_list('deleted', flat=True))
+        self.assertEqual(len(set(tokens)), 25)
+
+        self.assertEqual(UUIDItem.trashes.all().restore(), 25)
+        self.assertEqual(UUIDItem.objects.count(), 25)
+
+    def test_uuid_soft_delete_sliced(self):
+        self.assertEqual(UUIDItem.objects.order_by('pk')[:5].soft_delete(), 5)
+        self.assertEqual(UUIDItem.objects.count(), 20)
+
+    def test_boolean_soft_delete(self):
+        self.assertEqual(BooleanItem.objects.filter(name__in=['item1', 'item2']).soft_delete(), 2)
+        self.assertEqual(BooleanItem.objects.count(), 23)
+        self.assertEqual(BooleanItem.trashes.all().restore(), 2)
+        self.assertEqual(BooleanItem.objects.count(), 25)
+
+    def test_chunked_soft_delete(self):
+        progress = []
+
+        def receiver(sender, count, last_pk, **kwargs):
+            progress.append(count)
+
+        soft_delete_progress.connect(receiver, sender=BooleanItem)
+        try:
+            self.assertEqual(chunked_soft_delete(BooleanItem.objects.all(), True, batch_size=10), 25)
+        finally:
+            soft_delete_progress.disconnect(receiver, sender=BooleanItem)
+        self.assertEqual(progress, [10, 20, 25])
+        self.assertEqual(BooleanItem.objects.count(), 0)
+
+    def test_bulk_signals(self):
+        received = []
+
+        def pre_receiver(sender, pks, **kwargs):
+            # 发送前置信号时还未删除
+            received.append(('pre', len(pks), UUIDItem.objects.filter(pk__in=pks).count()))
+
+        def post_receiver(sender, pks, **kwargs):
+            received.append(('post', len(pks), UUIDItem.objects.filter(pk__in=pks).count()))
+
+        pre_bulk_soft_delete.connect(pre_receiver, sender=UUIDItem)
+        post_bulk_soft_delete.connect(post_receiver, sender=UUIDItem)
+        try:
+            self.assertEqual(UUIDItem.objects.all().soft_delete(), 25)
+        finally:
+            pre_bulk_soft_delete.disconnect(pre_receiver, sender=UUIDItem)
+            post_bulk_soft_delete.disconnect(post_receiver, sender=UUIDItem)
+        # 按soft_delete_batch_size分批发送
+        self.assertEqual(received, [
+            ('pre', 10, 10), ('post', 10, 0),
+            ('pre', 10, 10), ('post', 10, 0),
+            ('pre', 5, 5), ('post', 5, 0),
+        ])
+
+    def test_purge_expired_trashes(self):
+        DateTimeItem.objects.filter(name__in=['item1', 'item2', 'item3']).soft_delete()
+        DateTimeItem.trashes.filter(name='item1').update(delete_at=timezone.now() - timedelta(days=1))
+        DateTimeItem.trashes.exclude(name='item1').update(delete_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(purge_model(DateTimeItem, dry_run=True), 2)
+        self.assertEqual(purge_model(DateTimeItem, batch_size=1, throttle=0), 2)
+        self.assertEqual(DateTimeItem.all_objects.count(), 23)
+        self.assertEqual(DateTimeItem.trashes.count(), 1)